@@ -0,0 +1,153 @@
+"""
+Offline benchmarks for the insightbeam server, run with `python -m benchmarks.<name>` from the server directory.
+"""
+import datetime
+import random
+import statistics
+import time
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session
+
+from insightbeam.common import Article
+from insightbeam.config import Configuration
+from insightbeam.dal import add_source, add_source_items, initialize_engine
+from insightbeam.engine.search import Input
+
+
+_corpus_end = datetime.datetime(2023, 10, 1)
+
+
+def bench_config(**overrides) -> Configuration:
+    """
+    Build a configuration without reading the environment, only the values a benchmark needs are filled in
+    """
+    values: Dict = {
+        "openai_api_key": "",
+        "db_url": "sqlite+pysqlite:///:memory:",
+        "sengine_dir": "",
+        "search_retriever": "whoosh",
+        "sengine_batch_size": 500,
+        "sengine_flush_interval": 2.0,
+        "sengine_queue_size": 10_000,
+        "sengine_optimize_hour": None,
+        "sengine_sync_interval": 2.0,
+        "search_window_days": None,
+        "search_half_life_days": None,
+        "logs_dir": "",
+        "log_level": "WARNING",
+        "debug": False,
+        "dep_call_timeout": 10,
+        "dep_call_retry": 10,
+        "dep_call_breaker_threshold": 5,
+        "dep_call_breaker_reset": 30.0,
+        "dep_call_hedge": False,
+        "ledger_batch_size": 100,
+        "ledger_flush_interval": 5.0,
+        "ledger_queue_size": 10_000,
+        "analysis_model_tiers": "3000=gpt-3.5-turbo",
+        "counter_model_tiers": "3000=gpt-3.5-turbo",
+        "long_context_model": "gpt-3.5-turbo-16k",
+        "counter_mode": "map_reduce",
+        "counter_workers": 4,
+        "analysis_workers": 8,
+        "analysis_pack_tokens": 6000,
+        "analysis_pack_max_items": 8,
+        "events_buffer_size": 256,
+        "events_heartbeat": 15.0,
+        "browser_agent": "",
+        "download_workers": 16,
+        "extract_workers": 0,
+        "extract_queue_size": 32,
+        "html_cache_dir": "",
+        "html_cache_ttl": 7 * 24 * 60 * 60,
+        "html_cache_max_bytes": 512 * 1024 * 1024,
+        "feed_fulltext_min_words": 250,
+        "feed_fulltext_min_paragraphs": 3,
+        "compress_min_bytes": 1024,
+        "workers": 1,
+        "host_name": "127.0.0.1",
+        "port": 8000,
+    }
+    values.update(overrides)
+    return Configuration.model_construct(**values)
+
+
+def synthetic_corpus(
+    n_docs: int, n_topics: int = 50, doc_words: int = 300, seed: int = 7
+) -> Tuple[List[Input], List[int]]:
+    """
+    Generate documents drawn from per topic vocabularies plus a shared background vocabulary, returns the
+    documents and the topic each document was generated from. The documents are published evenly over a year.
+    """
+    rnd = random.Random(seed)
+    background = [f"common{i}" for i in range(2000)]
+    topics = [[f"topic{t}word{i}" for i in range(200)] for t in range(n_topics)]
+
+    docs = list()
+    labels = list()
+    for uuid in range(n_docs):
+        topic = uuid % n_topics
+        n_topic_words = doc_words // 15
+        words = rnd.choices(topics[topic], k=n_topic_words) + rnd.choices(
+            background, k=doc_words - n_topic_words
+        )
+        rnd.shuffle(words)
+        docs.append(
+            Input(
+                uuid=str(uuid),
+                url=f"https://example.com/{uuid}",
+                title=" ".join(words[:8]),
+                content=" ".join(words),
+                published=_corpus_end - datetime.timedelta(days=365 * uuid / n_docs),
+            )
+        )
+        labels.append(topic)
+    return (docs, labels)
+
+
+def seed_database(db_url: str, items: int, sources: int = 1) -> Engine:
+    """
+    Create the schema and store `items` synthetic source items spread over `sources` feeds
+    """
+    db_engine = initialize_engine(bench_config(db_url=db_url))
+    db_engine.echo = False
+    (docs, _labels) = synthetic_corpus(items)
+    with Session(db_engine) as session:
+        for source_idx in range(sources):
+            source = add_source(session, url=f"https://example.com/feed/{source_idx}")
+            add_source_items(
+                session,
+                source,
+                [
+                    Article(url=d.url, title=d.title, content=d.content)
+                    for d in docs[source_idx::sources]
+                ],
+            )
+    return db_engine
+
+
+def timed(func: Callable[[], object], repeat: int = 1) -> List[float]:
+    """
+    Wall clock timings in milliseconds
+    """
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(timings: List[float], pct: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    return {
+        "mean_ms": statistics.fmean(timings),
+        "p50_ms": percentile(timings, 50),
+        "p95_ms": percentile(timings, 95),
+    }
@@ -0,0 +1,106 @@
+"""
+Data access on a seeded SQLite database: listing a source's items, loading single items, analysis lookups and
+inserting new items (reported in rows per second as well).
+"""
+import argparse
+import json
+import random
+import tempfile
+from typing import Dict, List
+
+from sqlalchemy.orm import Session
+
+import insightbeam.dal as dal
+from benchmarks import seed_database, summarize, timed
+from benchmarks.parsing import llm_analysis
+from insightbeam.common import Article, Source
+from insightbeam.engine.interpreter import Analysis, ArticleAnalysis
+
+_sources = 10
+
+
+def _articles(batch: int, offset: int) -> List[Article]:
+    return [
+        Article(
+            url=f"https://example.com/new/{offset + i}",
+            title=f"New article {offset + i}",
+            content=" ".join(["budget talks resume after the deadline"] * 60),
+        )
+        for i in range(batch)
+    ]
+
+
+def run(
+    items: int = 10_000, analyses: int = 1_000, batch: int = 100, repeat: int = 50
+) -> Dict[str, Dict[str, float]]:
+    rnd = random.Random(7)
+    analysis = ArticleAnalysis(
+        article_url="https://example.com/0", analysis=Analysis.parse_xml(llm_analysis())
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_engine = seed_database(
+            f"sqlite+pysqlite:///{tmp}/sqlite.db", items, sources=_sources
+        )
+        with Session(db_engine) as session:
+            for item_id in range(1, min(analyses, items) + 1):
+                dal.add_source_item_analysis(session, item_id, analysis)
+
+            cases = {
+                "dal.get_source_items": summarize(
+                    timed(
+                        lambda: dal.get_source_items(session, rnd.randint(1, _sources)),
+                        repeat,
+                    )
+                ),
+                "dal.get_source_item": summarize(
+                    timed(
+                        lambda: dal.get_source_item(session, rnd.randint(1, items)),
+                        repeat,
+                    )
+                ),
+                "dal.get_source_item_analysis.hit": summarize(
+                    timed(
+                        lambda: dal.get_source_item_analysis(
+                            session, rnd.randint(1, min(analyses, items))
+                        ),
+                        repeat,
+                    )
+                ),
+                "dal.get_source_item_analysis.miss": summarize(
+                    timed(
+                        lambda: dal.get_source_item_analysis(
+                            session, items + rnd.randint(1, items)
+                        ),
+                        repeat,
+                    )
+                ),
+            }
+
+            source = Source(uuid=1, url="https://example.com/feed/0")
+            batches = iter(range(repeat))
+            insert_timings = timed(
+                lambda: dal.add_source_items(
+                    session, source, _articles(batch, next(batches) * batch)
+                ),
+                repeat,
+            )
+            cases["dal.add_source_items"] = summarize(insert_timings)
+            cases["dal.add_source_items"]["rows_per_s"] = (
+                batch * repeat / (sum(insert_timings) / 1000)
+            )
+        db_engine.dispose()
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(run(args.items, batch=args.batch, repeat=args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
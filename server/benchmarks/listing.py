@@ -0,0 +1,89 @@
+"""
+Serve large item listings through the api (`GET /sources/{id}/items` on a seeded database): the rows route as it
+runs in production and with debug validation, next to a route building and validating pydantic objects the way
+listings used to be served. Reported in requests per second and the peak memory allocated by a request.
+"""
+import argparse
+import json
+import tempfile
+import tracemalloc
+from typing import Dict, List
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+import insightbeam.dal as dal
+from benchmarks import bench_config, seed_database, summarize, timed
+from insightbeam.api import app
+from insightbeam.api import schemas as sch
+from insightbeam.config import Configuration
+from insightbeam.dal import get_session_supplier
+from insightbeam.dependency_manager import manager
+
+
+def _models_app() -> FastAPI:
+    models_app = FastAPI()
+
+    @models_app.get(
+        "/sources/{source_id}/items", response_model=sch.GetSourceItemsResponse
+    )
+    def get_source_items(
+        source_id: int, session: Session = Depends(manager.inject(Session))
+    ):
+        return sch.GetSourceItemsResponse(
+            items=dal.get_source_items(session, source_id)
+        )
+
+    return models_app
+
+
+def _peak_alloc_kb(client: TestClient, url: str) -> float:
+    tracemalloc.start()
+    try:
+        client.get(url)
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def _case(client: TestClient, url: str, repeat: int) -> Dict[str, float]:
+    client.get(url)
+    timings: List[float] = timed(lambda: client.get(url), repeat)
+    case = summarize(timings)
+    case["req_per_s"] = repeat / (sum(timings) / 1000)
+    case["peak_alloc_kb"] = _peak_alloc_kb(client, url)
+    return case
+
+
+def run(items: int = 10_000, repeat: int = 20) -> Dict[str, Dict[str, float]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_engine = seed_database(f"sqlite+pysqlite:///{tmp}/sqlite.db", items)
+        cfg = bench_config(db_url=str(db_engine.url))
+        manager.register(cfg)
+        manager.register(Session, supplier=get_session_supplier(db_engine))
+        url = "/sources/1/items"
+
+        cases = dict()
+        with TestClient(app) as client:
+            cases[f"list.items.{items}.rows"] = _case(client, url, repeat)
+            manager.register(
+                cfg.model_copy(update={"debug": True}), named=Configuration.__name__
+            )
+            cases[f"list.items.{items}.rows_debug"] = _case(client, url, repeat)
+        with TestClient(_models_app()) as client:
+            cases[f"list.items.{items}.models"] = _case(client, url, repeat)
+        db_engine.dispose()
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.items, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Parse realistic LLM reports: `Analysis.parse_xml`, `Analysis.parse_packed_xml`, `CounterAnalysis.parse_xml` and
+the streamed analysis parser.
+"""
+import argparse
+import json
+import random
+from typing import Dict
+
+from benchmarks import summarize, timed
+from insightbeam.engine.interpreter import (
+    Analysis,
+    AnalysisStreamParser,
+    CounterAnalysis,
+)
+
+_words = (
+    "the government budget deal leaders votes deadline economy inflation policy senate house spending "
+    "taxes agreement opposition analysts markets growth jobs report federal state plan critics support"
+).split()
+
+
+def _sentence(rnd: random.Random, words: int) -> str:
+    return " ".join(rnd.choices(_words, k=words)).capitalize() + "."
+
+
+def llm_analysis(view_points: int = 6, seed: int = 7) -> str:
+    """
+    An analysis report the way the model returns it, preamble and indentation included
+    """
+    rnd = random.Random(seed)
+    nodes = list()
+    for _ in range(view_points):
+        arguments = "\n".join(
+            f"                    <argument>{_sentence(rnd, 22)}</argument>"
+            for _ in range(rnd.randint(2, 4))
+        )
+        nodes.append(
+            f"""
+            <view-point>
+                <point>{_sentence(rnd, 14)}</point>
+                <arguments>
+{arguments}
+                </arguments>
+            </view-point>"""
+        )
+    return f"""Sure, here is the report for the article:
+
+     <analysis>
+        <subject>{_sentence(rnd, 8)}</subject>
+        <view-points>{"".join(nodes)}
+        </view-points>
+     </analysis>
+"""
+
+
+def llm_packed_analysis(articles: int = 8, view_points: int = 4) -> str:
+    """
+    A packed report, one `<analysis>` per article tagged with its id
+    """
+    reports = [
+        llm_analysis(view_points, seed=i)
+        .split("<analysis>", 1)[1]
+        .rsplit("</analysis>", 1)[0]
+        for i in range(articles)
+    ]
+    return "Here are the reports:\n" + "\n".join(
+        f'<analysis id="{i}">{report}</analysis>' for (i, report) in enumerate(reports)
+    )
+
+
+def llm_counter_analysis(counters: int = 5, seed: int = 7) -> str:
+    rnd = random.Random(seed)
+    nodes = "".join(
+        f"""
+            <counter>
+                <original>{_sentence(rnd, 14)}</original>
+                <other>{_sentence(rnd, 18)}</other>
+                <article-url>https://example.com/{rnd.randint(0, 10_000)}</article-url>
+            </counter>"""
+        for _ in range(counters)
+    )
+    return f"""<analysis>
+        <counters>{nodes}
+        </counters>
+    </analysis>"""
+
+
+def _stream(report: str, chunk_size: int = 16):
+    parser = AnalysisStreamParser()
+    for start in range(0, len(report), chunk_size):
+        chunk = report[start : start + chunk_size]  # noqa: E203
+        for _event in parser.feed(chunk):
+            pass
+
+
+def run(repeat: int = 200) -> Dict[str, Dict[str, float]]:
+    analysis = llm_analysis()
+    packed = llm_packed_analysis()
+    counter = llm_counter_analysis()
+    return {
+        "parse.analysis": summarize(
+            timed(lambda: Analysis.parse_xml(analysis), repeat)
+        ),
+        "parse.analysis_packed": summarize(
+            timed(lambda: Analysis.parse_packed_xml(packed), repeat)
+        ),
+        "parse.counter_analysis": summarize(
+            timed(lambda: CounterAnalysis.parse_xml(counter), repeat)
+        ),
+        "parse.analysis_stream": summarize(timed(lambda: _stream(analysis), repeat)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(run(args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Assemble the counter analysis prompt of an analysis and its related articles, no request is sent.
+"""
+import argparse
+import json
+from typing import Dict
+
+from benchmarks import bench_config, summarize, synthetic_corpus, timed
+from benchmarks.parsing import llm_analysis
+from insightbeam.common import Article
+from insightbeam.engine.interpreter import Analysis, Interpreter
+
+
+def run(related: int = 10, repeat: int = 200) -> Dict[str, Dict[str, float]]:
+    interpreter = Interpreter(bench_config(openai_api_key="sk-benchmark"))
+    analysis = Analysis.parse_xml(llm_analysis())
+    (docs, _labels) = synthetic_corpus(related, doc_words=1_000)
+    articles = [Article(url=d.url, title=d.title, content=d.content) for d in docs]
+
+    return {
+        "prompt.counter_analysis": summarize(
+            timed(lambda: interpreter._counter_messages(analysis, articles), repeat)
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--related", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(run(args.related, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
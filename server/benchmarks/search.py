@@ -0,0 +1,116 @@
+"""
+Compare the whoosh (BM25) and tf-idf retrievers for indexing time, query latency and recall.
+
+Recall@k is the share of the top k results generated from the same topic as the query document. Item searches
+are also measured restricted to a 30 day window with a 7 day half-life (`.search_item.window`), the corpus
+spans a year.
+"""
+import argparse
+import json
+import tempfile
+from typing import Dict, List, Union
+
+from benchmarks import bench_config, summarize, synthetic_corpus, timed
+from insightbeam.engine.search import Input, SearchEngine, create_search_engine
+
+
+def _recall(
+    sengine: SearchEngine, queries: List[Input], labels: List[int], k: int
+) -> float:
+    hits = 0
+    for query in queries:
+        results = sengine.search_item(query, limit=k)
+        hits += sum(
+            1 for r in results if labels[int(r.article_uuid)] == labels[int(query.uuid)]
+        )
+    return hits / (len(queries) * k)
+
+
+def bench_retriever(
+    retriever: str,
+    docs: List[Input],
+    labels: List[int],
+    queries: int,
+    k: int,
+    window_days: Union[float, None] = None,
+    half_life_days: Union[float, None] = None,
+) -> Dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = bench_config(
+            sengine_dir=tmp,
+            search_retriever=retriever,
+            search_window_days=window_days,
+            search_half_life_days=half_life_days,
+        )
+        sengine = create_search_engine(cfg)
+
+        def index():
+            sengine.add_documents(docs, lambda d: d)
+            sengine.flush()
+
+        (index_ms,) = timed(index)
+        sample = docs[:queries]
+        text_timings = [
+            t
+            for query in sample
+            for t in timed(lambda: sengine.search(query.title, limit=k))
+        ]
+        item_timings = [
+            t
+            for query in sample
+            for t in timed(lambda: sengine.search_item(query, limit=k))
+        ]
+        result = {
+            "retriever": retriever,
+            "documents": len(docs),
+            "index_ms": index_ms,
+            "search_text": summarize(text_timings),
+            "search_item": summarize(item_timings),
+            f"recall@{k}": _recall(sengine, sample, labels, k),
+        }
+        sengine.close()
+        return result
+
+
+def run(
+    sizes: List[int], queries: int = 100, k: int = 10
+) -> Dict[str, Dict[str, float]]:
+    """
+    The retriever benchmarks as flat cases for the benchmark suite
+    """
+    cases = dict()
+    for n_docs in sizes:
+        (docs, labels) = synthetic_corpus(n_docs)
+        for retriever in ["whoosh", "tfidf"]:
+            result = bench_retriever(retriever, docs, labels, queries, k)
+            prefix = f"search.{retriever}.{n_docs}"
+            cases[f"{prefix}.add_documents"] = summarize([result["index_ms"]])
+            cases[f"{prefix}.search"] = result["search_text"]
+            cases[f"{prefix}.search_item"] = dict(
+                result["search_item"], **{f"recall@{k}": result[f"recall@{k}"]}
+            )
+            windowed = bench_retriever(
+                retriever, docs, labels, queries, k, window_days=30, half_life_days=7
+            )
+            cases[f"{prefix}.search_item.window"] = dict(
+                windowed["search_item"], **{f"recall@{k}": windowed[f"recall@{k}"]}
+            )
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    (docs, labels) = synthetic_corpus(args.docs)
+    for retriever in ["whoosh", "tfidf"]:
+        print(
+            json.dumps(bench_retriever(retriever, docs, labels, args.queries, args.k))
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Serialize large item lists: the pydantic response model on its own and the way FastAPI serializes a
+`response_model` (validation, `jsonable_encoder`, `json.dumps`).
+"""
+import argparse
+import json
+from typing import Dict
+
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks import summarize, timed
+from insightbeam.api import schemas as sch
+from insightbeam.common import SourceItem
+
+
+def run(items: int = 10_000, repeat: int = 20) -> Dict[str, Dict[str, float]]:
+    source_items = [
+        SourceItem(
+            uuid=uuid,
+            title=f"Budget talks resume after the deadline passes {uuid}",
+            url=f"https://example.com/news/{uuid}",
+            source_uuid=uuid % 10,
+        )
+        for uuid in range(items)
+    ]
+    response = sch.GetSourceItemsResponse(items=source_items)
+
+    def fastapi_serialize():
+        validated = sch.GetSourceItemsResponse.model_validate(response)
+        return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+    return {
+        f"serialize.items.{items}.pydantic": summarize(
+            timed(response.model_dump_json, repeat)
+        ),
+        f"serialize.items.{items}.fastapi": summarize(timed(fastapi_serialize, repeat)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.items, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
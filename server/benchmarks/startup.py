@@ -0,0 +1,121 @@
+"""
+Measure the server's startup: the import time of the api in a fresh interpreter, the time from launching
+`python -m insightbeam` until it answers its first request (`/health/live`) and until it reports ready
+(`/health/ready`, engines built and search index primed over `--items` stored source items).
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Tuple
+
+from benchmarks import seed_database, summarize
+
+_import_snippet = (
+    "import time; start = time.perf_counter(); import insightbeam.api; "
+    "print((time.perf_counter() - start) * 1000)"
+)
+
+
+def _import_ms() -> float:
+    output = subprocess.check_output([sys.executable, "-c", _import_snippet])
+    return float(output.decode().strip())
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _status(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+
+def _boot(env: Dict[str, str], port: int, timeout: float) -> Tuple[float, float]:
+    """
+    Milliseconds until the first answered request and until ready
+    """
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "insightbeam"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        first_request_ms = None
+        while time.perf_counter() - start < timeout:
+            if first_request_ms is None and _status(f"{base}/health/live") == 200:
+                first_request_ms = (time.perf_counter() - start) * 1000
+            if first_request_ms is not None and _status(f"{base}/health/ready") == 200:
+                return (first_request_ms, (time.perf_counter() - start) * 1000)
+            time.sleep(0.01)
+        raise TimeoutError(f"Server not ready after {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--items", type=int, default=1_000)
+    parser.add_argument("--retriever", default="whoosh")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    import_timings = [_import_ms() for _ in range(args.runs)]
+    first_request_timings: List[float] = list()
+    ready_timings: List[float] = list()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite+pysqlite:///{tmp}/sqlite.db"
+        seed_database(db_url, args.items)
+        for run in range(args.runs):
+            port = _free_port()
+            env = dict(
+                os.environ,
+                OPENAI_API_KEY="sk-benchmark",
+                DB_URL=db_url,
+                SENGINE_DIR=os.path.join(tmp, "index"),
+                SEARCH_RETRIEVER=args.retriever,
+                LOGS_DIR=tmp,
+                LOG_LEVEL="WARNING",
+                HTML_CACHE_DIR=os.path.join(tmp, "html_cache"),
+                HOST_NAME="127.0.0.1",
+                PORT=str(port),
+                WORKERS="1",
+            )
+            (first_request_ms, ready_ms) = _boot(env, port, args.timeout)
+            first_request_timings.append(first_request_ms)
+            ready_timings.append(ready_ms)
+
+    print(
+        json.dumps(
+            {
+                "items": args.items,
+                "retriever": args.retriever,
+                "import": summarize(import_timings),
+                "first_request": summarize(first_request_timings),
+                "ready": summarize(ready_timings),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
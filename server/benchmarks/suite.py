@@ -0,0 +1,130 @@
+"""
+Run every offline benchmark into a results file and compare two results files for regressions.
+
+    python -m benchmarks.suite run --out base.json
+    python -m benchmarks.suite run --out head.json
+    python -m benchmarks.suite compare base.json head.json --threshold 0.1
+
+`compare` exits with status 1 when a case got slower than the threshold allows.
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks import dal, listing, parsing, prompts, search, serialization
+
+Cases = Dict[str, Dict[str, float]]
+
+
+def _suites(args: argparse.Namespace) -> List[Tuple[str, Callable[[], Cases]]]:
+    sizes = [int(size) for size in args.sizes.split(",")]
+    return [
+        ("parse", lambda: parsing.run(args.repeat)),
+        ("prompt", lambda: prompts.run(repeat=args.repeat)),
+        ("serialize", lambda: serialization.run(max(sizes), repeat=20)),
+        ("list", lambda: listing.run(max(sizes), repeat=20)),
+        ("dal", lambda: dal.run(min(sizes), repeat=args.repeat)),
+        ("search", lambda: search.run(sizes, queries=args.queries)),
+    ]
+
+
+def _git_commit() -> str:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args: argparse.Namespace):
+    results: Cases = dict()
+    for name, suite in _suites(args):
+        if args.only is not None and name not in args.only.split(","):
+            continue
+        print(f"Running {name} benchmarks", file=sys.stderr)
+        results.update(suite())
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": args.sizes,
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.out}", file=sys.stderr)
+
+
+def compare(args: argparse.Namespace) -> int:
+    with open(args.base) as f:
+        base: Cases = json.load(f)["results"]
+    with open(args.head) as f:
+        head: Cases = json.load(f)["results"]
+
+    regressions = 0
+    print(f"{'case':<48} {'base':>10} {'head':>10} {'change':>8}")
+    for case in sorted(set(base) & set(head)):
+        (before, after) = (base[case][args.metric], head[case][args.metric])
+        change = (after - before) / before if before > 0 else 0.0
+        flag = ""
+        if change > args.threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        elif change < -args.threshold:
+            flag = "  improved"
+        print(f"{case:<48} {before:>10.3f} {after:>10.3f} {change:>+8.1%}{flag}")
+
+    for case in sorted(set(base) ^ set(head)):
+        print(f"{case:<48} only in {'base' if case in base else 'head'}")
+
+    print(f"{regressions} regression(s) above {args.threshold:.0%} on {args.metric}")
+    return 1 if regressions > 0 else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--out", default="benchmark-results.json")
+    run_parser.add_argument(
+        "--sizes",
+        default="10000,100000",
+        help="Comma separated corpus sizes for the search benchmarks",
+    )
+    run_parser.add_argument("--repeat", type=int, default=50)
+    run_parser.add_argument("--queries", type=int, default=100)
+    run_parser.add_argument(
+        "--only", help="Comma separated suites: parse,prompt,serialize,dal,search"
+    )
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("head")
+    compare_parser.add_argument("--metric", default="p50_ms")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,37 @@
 from __future__ import annotations
 
 import logging
+import os
+import threading
 
-from sqlalchemy import select
+from sqlalchemy import Engine
 from sqlalchemy.orm import Session
 
 from .api import app as _app
+from .api.compression import CompressionMiddleware
 from .config import Configuration
-from .dal import get_session_supplier, initialize_engine
-from .dal.schemas import SourceItem as DbSourceItem
+from .core import to_search_input
+from .core.events import EventBus
+from .core.health import Readiness
+from .core.indexsync import IndexSynchronizer
+from .core.ledger import UsageLedger
+from .dal import (
+    get_session_supplier,
+    initialize_engine,
+    iter_source_items_with_content,
+)
 from .dependency_manager import manager
+from .engine.election import LeaderLock, file_lock
 from .engine.interpreter import Interpreter
 from .engine.rssreader import RSSReader
-from .engine.search import Input, SearchEngine
+from .engine.search import SearchEngine, create_search_engine
 
 _logger = logging.getLogger(__name__)
 
 
 def prime_search_engine(sengine: SearchEngine, session: Session):
-    results = session.execute(
-        select(
-            DbSourceItem.uuid,
-            DbSourceItem.title,
-            DbSourceItem.content,
-            DbSourceItem.url,
-        )
-    )
-    sengine.add_documents(
-        [
-            DbSourceItem(uuid=uuid, title=title, content=content, url=url)
-            for (uuid, title, content, url) in results
-        ],
-        lambda item: Input(
-            uuid=str(item.uuid), url=item.url, title=item.title, content=item.content
-        ),
-    )
+    for items in iter_source_items_with_content(session):
+        sengine.add_documents(items, to_search_input)
     _logger.info("Primed search engine!")
 
 
@@ -49,21 +46,103 @@ def setup_logging(cfg: Configuration):
 
 cfg = Configuration()
 setup_logging(cfg)
-db_engine = initialize_engine(cfg)
-interpreter = Interpreter(cfg)
-sengine = SearchEngine(cfg)
-reader = RSSReader(cfg)
+readiness = Readiness(manager, [SearchEngine, RSSReader, Interpreter])
+
+
+def build_search_engine(db_engine: Engine) -> SearchEngine:
+    """
+    With more than one worker the index is created one worker at a time and a single elected worker writes it
+    """
+    if cfg.workers <= 1:
+        return create_search_engine(cfg)
+
+    leader = LeaderLock(os.path.join(cfg.sengine_dir, "writer.lock"))
+    with file_lock(os.path.join(cfg.sengine_dir, "init.lock")):
+        sengine = create_search_engine(
+            cfg, clean=False, read_only=not leader.try_acquire()
+        )
+    synchronizer = IndexSynchronizer(cfg, sengine, leader, db_engine)
+    synchronizer.start()
+    manager.register(synchronizer)
+    return sengine
+
 
-manager.register(reader)
-manager.register(interpreter)
-manager.register(sengine)
-manager.register(Session, supplier=get_session_supplier(db_engine))
+def warm_up(db_engine: Engine):
+    """
+    Build the engines ahead of the first request needing them and prime the search index, the worker reports
+    ready once done
+    """
+    try:
+        sengine: SearchEngine = manager.get(SearchEngine)
+        manager.get(RSSReader)
+        manager.get(Interpreter)
 
-prime_search_engine(sengine, manager.inject(Session)())
+        if cfg.workers > 1:
+            manager.get(IndexSynchronizer).wait_synced()
+        else:
+            with Session(db_engine) as session:
+                prime_search_engine(sengine, session)
+        sengine.flush()
+        readiness.mark_primed()
+        _logger.info("Worker is ready")
+    except Exception as e:
+        _logger.error("Exception warming up the worker %s", e)
 
+
+def start_worker():
+    """
+    Runs in every worker process before it accepts requests, only the database is set up here, the engines
+    are built lazily (and warmed up in the background) so the port is bound right away.
+    """
+    if cfg.workers > 1:
+        os.makedirs(cfg.sengine_dir, exist_ok=True)
+        # Schema creation and migrations run one worker at a time
+        with file_lock(os.path.join(cfg.sengine_dir, "init.lock")):
+            db_engine = initialize_engine(cfg)
+    else:
+        db_engine = initialize_engine(cfg)
+
+    ledger = UsageLedger(cfg, db_engine)
+    manager.register(cfg)
+    manager.register(Session, supplier=get_session_supplier(db_engine))
+    manager.register(readiness)
+    manager.register(ledger)
+    manager.register(EventBus(cfg.events_buffer_size))
+    manager.register_lazy(SearchEngine, lambda: build_search_engine(db_engine))
+    manager.register_lazy(RSSReader, lambda: RSSReader(cfg))
+    manager.register_lazy(Interpreter, lambda: Interpreter(cfg, ledger.record))
+
+    threading.Thread(
+        target=warm_up, args=(db_engine,), name="warm-up", daemon=True
+    ).start()
+
+
+def stop_worker():
+    if manager.is_built(IndexSynchronizer):
+        manager.get(IndexSynchronizer).stop()
+    elif manager.is_built(SearchEngine):
+        manager.get(SearchEngine).close()
+    if manager.is_built(RSSReader):
+        manager.get(RSSReader).close()
+    if manager.is_built(UsageLedger):
+        manager.get(UsageLedger).close()
+
+
+_app.add_event_handler("startup", start_worker)
+_app.add_event_handler("shutdown", stop_worker)
+_app.add_middleware(CompressionMiddleware, minimum_size=cfg.compress_min_bytes)
 app = _app
 
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host=cfg.host_name, port=cfg.port)
+    if cfg.workers > 1:
+        # Workers import the app themselves, each one sets itself up on startup
+        uvicorn.run(
+            "insightbeam.__main__:app",
+            host=cfg.host_name,
+            port=cfg.port,
+            workers=cfg.workers,
+        )
+    else:
+        uvicorn.run(app, host=cfg.host_name, port=cfg.port)
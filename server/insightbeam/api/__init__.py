@@ -1,23 +1,91 @@
+import hashlib
 import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Type
 
-from fastapi import Body, Depends, FastAPI, HTTPException
+from fastapi import Body, Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Session
 
 import insightbeam.core as core
 from insightbeam.api import schemas as sch
+from insightbeam.config import Configuration
+from insightbeam.core.events import EventBus
+from insightbeam.core.health import Readiness
 from insightbeam.dependency_manager import manager as m
-from insightbeam.engine.interpreter import Interpreter
+from insightbeam.engine.interpreter import ArticleAnalysis, Interpreter
 from insightbeam.engine.rssreader import RSSReader
 from insightbeam.engine.search import SearchEngine
 
 app = FastAPI()
 _logger = logging.getLogger(__name__)
+# Items only change when they are re-extracted, analyses never change once generated
+_cache_control = {
+    "item": "public, max-age=3600",
+    "analysis": "public, max-age=86400",
+}
+
+
+def _etag(payload: str) -> str:
+    return '"{}"'.format(hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32])
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is None:
+        return False
+    # If-None-Match uses the weak comparison, W/ prefixed tags (compressed responses, proxies) still match
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _cacheable_response(
+    request: Request, etag: str, cache_control: str, body: Callable[[], str]
+) -> Response:
+    """
+    304 when the client already holds `etag`, otherwise the json `body` (only serialized then)
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body(), media_type="application/json", headers=headers)
+
+
+def _analysis_response(request: Request, analysis_json: str) -> Response:
+    """
+    The ETag of an analysis is derived from its persisted json so a revalidation never needs the interpreter
+    """
+    return _cacheable_response(
+        request,
+        _etag(analysis_json),
+        _cache_control["analysis"],
+        lambda: sch.GetSourceItemAnalysisResponse(
+            analysis=ArticleAnalysis.model_validate_json(analysis_json)
+        ).model_dump_json(),
+    )
+
+
+def _rows_response(
+    cfg: Configuration, response_model: Type[BaseModel], content: Dict[str, Any]
+) -> Response:
+    """
+    Listings are serialized from plain rows, `response_model` only documents them, in debug they are checked
+    against it
+    """
+    if cfg.debug:
+        response_model.model_validate(content)
+    return ORJSONResponse(content)
 
 
 @app.get("/sources", response_model=sch.GetSourcesResponse)
-def get_sources(session: Session = Depends(m.inject(Session))):
-    return sch.GetSourcesResponse(sources=core.get_sources(session))
+def get_sources(
+    session: Session = Depends(m.inject(Session)),
+    cfg: Configuration = Depends(m.inject(Configuration)),
+):
+    return _rows_response(
+        cfg, sch.GetSourcesResponse, {"sources": core.get_sources(session)}
+    )
 
 
 @app.post("/sources", response_model=sch.CreateSourceResponse)
@@ -35,72 +103,237 @@ def pull_from_sources(
     source_id: int,
     reader: RSSReader = Depends(m.inject(RSSReader)),
     session: Session = Depends(m.inject(Session)),
+    sengine: SearchEngine = Depends(m.inject(SearchEngine)),
+    events: EventBus = Depends(m.inject(EventBus)),
 ):
     try:
-        (new_items, failed) = core.pull_from_sources(source_id, reader, session)
+        (new_items, failed, stats) = core.pull_from_sources(
+            source_id, reader, session, sengine, events
+        )
     except NoResultFound:
         raise HTTPException(status_code=404, detail=f"Source[id:{source_id}] not found")
 
     return sch.PullSourcesResponse(
         new_items=new_items,
         failed=failed,
+        stats=stats,
     )
 
 
+@app.get("/sources/{source_id}/analyze", response_model=sch.AnalyzeSourceItemsResponse)
+def analyze_source_items(
+    source_id: int,
+    limit: int = Query(default=50, ge=1, le=500),
+    session: Session = Depends(m.inject(Session)),
+    interpreter: Interpreter = Depends(m.inject(Interpreter)),
+    events: EventBus = Depends(m.inject(EventBus)),
+):
+    try:
+        (analyzed, failed) = core.analyze_source_items(
+            source_id, limit, session, interpreter, events
+        )
+    except NoResultFound:
+        raise HTTPException(status_code=404, detail=f"Source[id:{source_id}] not found")
+
+    return sch.AnalyzeSourceItemsResponse(analyzed=analyzed, failed=failed)
+
+
+@app.get("/sources/{source_id}/stats", response_model=sch.GetSourceStatsResponse)
+def get_source_stats(
+    source_id: int,
+    reader: RSSReader = Depends(m.inject(RSSReader)),
+    session: Session = Depends(m.inject(Session)),
+):
+    try:
+        return sch.GetSourceStatsResponse(
+            stats=core.get_source_stats(source_id, reader, session)
+        )
+    except NoResultFound:
+        raise HTTPException(status_code=404, detail=f"Source[id:{source_id}] not found")
+
+
 @app.get("/sources/{source_id}/items", response_model=sch.GetSourceItemsResponse)
-def get_source_items(source_id: int, session: Session = Depends(m.inject(Session))):
+def get_source_items(
+    source_id: int,
+    session: Session = Depends(m.inject(Session)),
+    cfg: Configuration = Depends(m.inject(Configuration)),
+):
     try:
-        return sch.GetSourceItemsResponse(
-            items=core.get_source_items(source_id, session)
+        return _rows_response(
+            cfg,
+            sch.GetSourceItemsResponse,
+            {"items": core.get_source_items(source_id, session)},
         )
     except NoResultFound:
         raise HTTPException(status_code=404, detail=f"Source[id:{source_id}] not found")
 
 
 @app.get("/items/{item_id}", response_model=sch.GetSourceItemResponse)
-def get_source_item(item_id: int, session: Session = Depends(m.inject(Session))):
+def get_source_item(
+    item_id: int, request: Request, session: Session = Depends(m.inject(Session))
+):
     try:
-        return sch.GetSourceItemResponse(item=core.get_source_item(item_id, session))
+        item = core.get_source_item(item_id, session)
     except NoResultFound:
         raise HTTPException(
             status_code=404, detail=f"item[id:{str(item_id)}] not found"
         )
 
+    payload = sch.GetSourceItemResponse(item=item).model_dump_json()
+    return _cacheable_response(
+        request, _etag(payload), _cache_control["item"], lambda: payload
+    )
+
 
 @app.get("/items/{item_id}/analyze", response_model=sch.GetSourceItemAnalysisResponse)
 def get_source_item_analysis(
+    item_id: int,
+    request: Request,
+    session: Session = Depends(m.inject(Session)),
+    interpreter: Interpreter = Depends(m.inject(Interpreter)),
+    events: EventBus = Depends(m.inject(EventBus)),
+):
+    analysis_json = core.get_stored_source_item_analysis(item_id, session)
+    if analysis_json is None:
+        try:
+            analysis_json = core.get_source_item_analysis(
+                item_id, session, interpreter, events
+            ).model_dump_json()
+        except NoResultFound:
+            raise HTTPException(
+                status_code=404, detail=f"item[id:{str(item_id)}] not found"
+            )
+        except RuntimeError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    return _analysis_response(request, analysis_json)
+
+
+@app.get("/items/{item_id}/analyze/stream")
+def stream_source_item_analysis(
     item_id: int,
     session: Session = Depends(m.inject(Session)),
     interpreter: Interpreter = Depends(m.inject(Interpreter)),
+    event_bus: EventBus = Depends(m.inject(EventBus)),
 ):
+    """
+    Server-Sent Events: `subject` and `view_point` events as the model produces them, then `analysis` with the
+    complete (persisted) analysis or `error`.
+    """
     try:
-        return sch.GetSourceItemAnalysisResponse(
-            analysis=core.get_source_item_analysis(item_id, session, interpreter)
+        events = core.stream_source_item_analysis(
+            item_id, session, interpreter, event_bus
         )
     except NoResultFound:
         raise HTTPException(
             status_code=404, detail=f"item[id:{str(item_id)}] not found"
         )
-    except RuntimeError as e:
-        raise HTTPException(status_code=503, detail=str(e))
+
+    return StreamingResponse(
+        (
+            f"event: {e.event}\ndata: {e.model_dump_json(exclude_none=True)}\n\n"
+            for e in events
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/items/{item_id}/counters", response_model=sch.GetSourceItemAnalysisResponse)
 def get_source_item_counters(
     item_id: int,
+    request: Request,
     session: Session = Depends(m.inject(Session)),
     interpreter: Interpreter = Depends(m.inject(Interpreter)),
     sengine: SearchEngine = Depends(m.inject(SearchEngine)),
+    events: EventBus = Depends(m.inject(EventBus)),
 ):
-    try:
-        return sch.GetSourceItemAnalysisResponse(
-            analysis=core.get_source_item_counters(
-                item_id, session, interpreter, sengine
+    analysis_json = core.get_stored_source_item_counters(item_id, session)
+    if analysis_json is None:
+        try:
+            analysis_json = core.get_source_item_counters(
+                item_id, session, interpreter, sengine, events
+            ).model_dump_json()
+        except NoResultFound:
+            raise HTTPException(
+                status_code=404, detail=f"item[id:{str(item_id)}] not found"
             )
-        )
-    except NoResultFound:
-        raise HTTPException(
-            status_code=404, detail=f"item[id:{str(item_id)}] not found"
-        )
-    except RuntimeError as e:
-        raise HTTPException(status_code=503, detail=str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    return _analysis_response(request, analysis_json)
+
+
+async def _event_stream(
+    events: EventBus, sources: List[int], heartbeat: float
+) -> AsyncIterator[str]:
+    subscription = events.subscribe(set(sources) or None)
+    try:
+        while True:
+            (published, dropped) = await subscription.get(heartbeat)
+            if dropped:
+                yield f'event: overflow\ndata: {{"dropped": {dropped}}}\n\n'
+            for e in published:
+                yield f"event: {e.event}\ndata: {e.model_dump_json(exclude_none=True)}\n\n"
+            if not published and not dropped:
+                # Keeps proxies from closing an idle stream
+                yield ": heartbeat\n\n"
+    finally:
+        events.unsubscribe(subscription)
+
+
+@app.get("/events")
+async def get_events(
+    source: List[int] = Query(default=[]),
+    events: EventBus = Depends(m.inject(EventBus)),
+    cfg: Configuration = Depends(m.inject(Configuration)),
+):
+    """
+    Server-Sent Events: `item_created` when a pull stores new items, `analysis_ready` and `counters_ready` once
+    an analysis has been persisted, limited to the sources given as `?source=1&source=2`. `overflow` tells the
+    client it read too slowly and missed events, it should refetch what it shows.
+    """
+    return StreamingResponse(
+        _event_stream(events, source, cfg.events_heartbeat),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/status/interpreter", response_model=sch.GetInterpreterStatusResponse)
+def get_interpreter_status(interpreter: Interpreter = Depends(m.inject(Interpreter))):
+    return sch.GetInterpreterStatusResponse(upstream=interpreter.resilience_state())
+
+
+@app.get("/usage/sources", response_model=sch.GetSourceUsageResponse)
+def get_usage_by_source(
+    days: int = Query(default=30, ge=1),
+    session: Session = Depends(m.inject(Session)),
+):
+    return sch.GetSourceUsageResponse(sources=core.get_usage_by_source(session, days))
+
+
+@app.get("/usage/days", response_model=sch.GetDailyUsageResponse)
+def get_usage_by_day(
+    days: int = Query(default=30, ge=1),
+    session: Session = Depends(m.inject(Session)),
+):
+    return sch.GetDailyUsageResponse(days=core.get_usage_by_day(session, days))
+
+
+@app.get("/health/live", response_model=sch.GetLivenessResponse)
+def get_liveness():
+    return sch.GetLivenessResponse(status="ok")
+
+
+@app.get("/health/ready", response_model=sch.GetReadinessResponse)
+def get_readiness(
+    response: Response,
+    session: Session = Depends(m.inject(Session)),
+    readiness: Readiness = Depends(m.inject(Readiness)),
+):
+    """
+    503 until the engines have been built and the search index primed, live workers may still be warming up
+    """
+    state = readiness.state(session)
+    if not state.ready:
+        response.status_code = 503
+    return sch.GetReadinessResponse(readiness=state)
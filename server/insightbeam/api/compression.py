@@ -0,0 +1,121 @@
+import gzip
+from typing import Dict, List, Union
+
+import brotli  # type: ignore[import]
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class CompressionMiddleware:
+    """
+    Brotli or gzip compression of complete response bodies of at least `minimum_size` bytes.
+
+    Streamed responses (Server-Sent Events) pass through untouched so their events are not held back in a
+    compression buffer.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 5,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    _supported = ["br", "gzip"]
+
+    def _encoding(self, scope: Scope) -> Union[str, None]:
+        """
+        The supported encoding with the highest q-value, brotli on a tie. Encodings given q=0 are refused, `*`
+        stands for the ones not listed.
+        """
+        qvalues: Dict[str, float] = dict()
+        for entry in Headers(scope=scope).get("Accept-Encoding", "").split(","):
+            (coding, *params) = [part.strip() for part in entry.split(";")]
+            qvalue = 1.0
+            for param in params:
+                (name, _, value) = param.partition("=")
+                if name.strip().lower() == "q":
+                    try:
+                        qvalue = float(value)
+                    except ValueError:
+                        qvalue = 0.0
+            if coding:
+                qvalues[coding.lower()] = qvalue
+
+        wildcard = qvalues.get("*", 0.0)
+        ranked = [
+            (qvalues.get(encoding, wildcard), encoding) for encoding in self._supported
+        ]
+        (qvalue, encoding) = max(
+            ranked, key=lambda r: (r[0], -self._supported.index(r[1]))
+        )
+        return encoding if qvalue > 0 else None
+
+    def _weaken_etag(self, headers: MutableHeaders):
+        """
+        A compressed body is not byte for byte the representation the route tagged, its ETag can only be weak.
+        The routes compare If-None-Match weakly, so revalidations still match.
+        """
+        etag = headers.get("ETag")
+        if etag is not None and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+
+    def _compress(self, encoding: str, body: bytes) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = self._encoding(scope) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Union[Message, None] = None
+        body: List[bytes] = list()
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, passthrough
+
+            if passthrough:
+                await send(message)
+            elif message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body" and start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                if message.get("more_body", False) and len(body) == 0:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                body.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+
+                content = b"".join(body)
+                if start["status"] == 304:
+                    # Carries the validator of the compressed response it revalidates
+                    self._weaken_etag(headers)
+                    headers.add_vary_header("Accept-Encoding")
+                elif (
+                    len(content) >= self.minimum_size
+                    and "content-encoding" not in headers
+                ):
+                    content = self._compress(encoding, content)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(content))
+                    headers.add_vary_header("Accept-Encoding")
+                    self._weaken_etag(headers)
+                await send(start)
+                await send({"type": "http.response.body", "body": content})
+            else:
+                await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -2,8 +2,11 @@ from typing import List
 
 from pydantic import BaseModel
 
-from insightbeam.common import Source, SourceItem
+from insightbeam.common import DailyUsage, Source, SourceItem, SourceUsage
+from insightbeam.core.health import ReadinessState
 from insightbeam.engine.interpreter import ArticleAnalysis
+from insightbeam.engine.resilience import ResilienceState
+from insightbeam.engine.rssreader import LoadStats
 
 
 class GetSourcesResponse(BaseModel):
@@ -21,6 +24,16 @@ class CreateSourceResponse(BaseModel):
 class PullSourcesResponse(BaseModel):
     new_items: List[SourceItem]
     failed: List[str]
+    stats: LoadStats
+
+
+class AnalyzeSourceItemsResponse(BaseModel):
+    analyzed: List[int]
+    failed: List[int]
+
+
+class GetSourceStatsResponse(BaseModel):
+    stats: LoadStats
 
 
 class GetSourceItemsResponse(BaseModel):
@@ -33,3 +46,23 @@ class GetSourceItemResponse(BaseModel):
 
 class GetSourceItemAnalysisResponse(BaseModel):
     analysis: ArticleAnalysis
+
+
+class GetInterpreterStatusResponse(BaseModel):
+    upstream: ResilienceState
+
+
+class GetSourceUsageResponse(BaseModel):
+    sources: List[SourceUsage]
+
+
+class GetDailyUsageResponse(BaseModel):
+    days: List[DailyUsage]
+
+
+class GetLivenessResponse(BaseModel):
+    status: str
+
+
+class GetReadinessResponse(BaseModel):
+    readiness: ReadinessState
@@ -1,3 +1,6 @@
+from datetime import date, datetime
+from typing import Union
+
 from pydantic import BaseModel
 
 
@@ -5,6 +8,8 @@ class Article(BaseModel):
     title: str
     content: str
     url: str
+    # Naive UTC, taken from the feed entry when it carries one
+    published: Union[datetime, None] = None
 
 
 class Source(BaseModel):
@@ -15,6 +20,47 @@ class Source(BaseModel):
 class SourceItem(BaseModel):
     uuid: int
     title: str
-    content: str
     url: str
     source_uuid: int
+    # Naive UTC, None for items stored before publication dates were kept
+    published: Union[datetime, None] = None
+    # Only loaded when a single item is requested
+    content: Union[str, None] = None
+
+
+class LlmCall(BaseModel):
+    """
+    A single chat model call as kept in the usage ledger
+    """
+
+    operation: str
+    # The model the prompt was routed to and the prompt's token count it was routed on
+    model: str
+    routed_tokens: Union[int, None] = None
+    # None when the model does not report its usage (e.g. streamed completions)
+    prompt_tokens: Union[int, None] = None
+    completion_tokens: Union[int, None] = None
+    latency_ms: float
+    retries: int = 0
+    outcome: str
+    source_item_uuid: Union[int, None] = None
+    source_uuid: Union[int, None] = None
+    # Naive UTC
+    created_at: datetime
+
+
+class Usage(BaseModel):
+    calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    avg_prompt_tokens: Union[float, None]
+    p95_latency_ms: Union[float, None]
+
+
+class SourceUsage(Usage):
+    # None for calls not made for a source item
+    source_uuid: Union[int, None]
+
+
+class DailyUsage(Usage):
+    day: date
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Generic, List, TypeVar, Union
+
+_logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+
+class _Flush:
+    done: threading.Event
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class BatchWriter(Generic[T]):
+    """
+    Single background thread committing the items handed to it in batches.
+
+    Producers enqueue items and return immediately, the queue is bounded so producers block (backpressure) only
+    once `queue_size` items are waiting. Items are committed in batches of `batch_size` or after
+    `flush_interval` seconds, whichever comes first. A failed commit is retried a few times before its batch is
+    dropped.
+    """
+
+    _commit: Callable[[List[T]], None]
+    _batch_size: int
+    _flush_interval: float
+    _commit_attempts = 3
+    _retry_delay = 1.0
+    # How long the thread waits for items before calling `_idle`
+    _idle_interval = 60.0
+    _queue: queue.Queue
+    _thread: threading.Thread
+    _closed: bool
+
+    def __init__(
+        self,
+        commit: Callable[[List[T]], None],
+        batch_size: int = 500,
+        flush_interval: float = 2.0,
+        queue_size: int = 10_000,
+        name: str = "batch-writer",
+    ):
+        self._commit = commit
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, items: List[T], block: bool = True) -> int:
+        """
+        Returns the number of items enqueued, without `block` the items that do not fit the queue are dropped
+
+        :raise RuntimeError: When the writer has been closed
+        """
+        if self._closed:
+            raise RuntimeError(f"{self._thread.name} is closed")
+        for enqueued, item in enumerate(items):
+            try:
+                self._queue.put(item, block=block)
+            except queue.Full:
+                return enqueued
+        return len(items)
+
+    def flush(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Wait until every item enqueued before the call has been committed
+        """
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout: Union[float, None] = None):
+        if not self._closed:
+            self._closed = True
+            self.flush(timeout)
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _idle(self):
+        """
+        Called from the writer thread when nothing was enqueued for `_idle_interval` seconds
+        """
+        ...
+
+    def _run(self) -> None:
+        batch: List[T] = list()
+        deadline: Union[float, None] = None
+
+        while True:
+            wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(
+                    timeout=wait if wait is not None else self._idle_interval
+                )
+            except queue.Empty:
+                if len(batch) > 0:
+                    self._commit_batch(batch)
+                    (batch, deadline) = (list(), None)
+                else:
+                    self._idle()
+                continue
+
+            if item is None:
+                self._commit_batch(batch)
+                return
+            elif isinstance(item, _Flush):
+                self._commit_batch(batch)
+                (batch, deadline) = (list(), None)
+                item.done.set()
+                continue
+
+            batch.append(item)
+            deadline = deadline or time.monotonic() + self._flush_interval
+            if len(batch) >= self._batch_size or time.monotonic() >= deadline:
+                self._commit_batch(batch)
+                (batch, deadline) = (list(), None)
+
+    def _commit_batch(self, batch: List[T]):
+        if len(batch) == 0:
+            return
+
+        for attempt in range(1, self._commit_attempts + 1):
+            try:
+                self._commit(batch)
+                return
+            except Exception as e:
+                _logger.error(
+                    "%s: exception committing %s items (attempt %s/%s) %s",
+                    self._thread.name,
+                    len(batch),
+                    attempt,
+                    self._commit_attempts,
+                    e,
+                )
+                time.sleep(self._retry_delay * attempt)
+        _logger.error(
+            "%s: dropped %s items after repeated commit failures",
+            self._thread.name,
+            len(batch),
+        )
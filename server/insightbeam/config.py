@@ -1,5 +1,6 @@
 import logging
 import os
+from typing import Union
 
 from dotenv import load_dotenv
 from pydantic import BaseModel
@@ -11,11 +12,46 @@ class Configuration(BaseModel):
     openai_api_key: str
     db_url: str
     sengine_dir: str
+    search_retriever: str
+    sengine_batch_size: int
+    sengine_flush_interval: float
+    sengine_queue_size: int
+    sengine_optimize_hour: Union[int, None]
+    sengine_sync_interval: float
+    search_window_days: Union[float, None]
+    search_half_life_days: Union[float, None]
     logs_dir: str
     log_level: str
+    debug: bool
     dep_call_timeout: int
     dep_call_retry: int
+    dep_call_breaker_threshold: int
+    dep_call_breaker_reset: float
+    dep_call_hedge: bool
+    ledger_batch_size: int
+    ledger_flush_interval: float
+    ledger_queue_size: int
+    analysis_model_tiers: str
+    counter_model_tiers: str
+    long_context_model: str
+    counter_mode: str
+    counter_workers: int
+    analysis_workers: int
+    analysis_pack_tokens: int
+    analysis_pack_max_items: int
+    events_buffer_size: int
+    events_heartbeat: float
     browser_agent: str
+    download_workers: int
+    extract_workers: int
+    extract_queue_size: int
+    html_cache_dir: str
+    html_cache_ttl: int
+    html_cache_max_bytes: int
+    feed_fulltext_min_words: int
+    feed_fulltext_min_paragraphs: int
+    compress_min_bytes: int
+    workers: int
     host_name: str
     port: int
 
@@ -26,10 +62,57 @@ class Configuration(BaseModel):
                 "openai_api_key": os.getenv("OPENAI_API_KEY"),
                 "db_url": os.getenv("DB_URL"),
                 "sengine_dir": os.getenv("SENGINE_DIR"),
+                "search_retriever": os.getenv("SEARCH_RETRIEVER", "whoosh"),
+                "sengine_batch_size": os.getenv("SENGINE_BATCH_SIZE", 500),
+                "sengine_flush_interval": os.getenv("SENGINE_FLUSH_INTERVAL", 2.0),
+                "sengine_queue_size": os.getenv("SENGINE_QUEUE_SIZE", 10_000),
+                "sengine_optimize_hour": os.getenv("SENGINE_OPTIMIZE_HOUR", 3) or None,
+                "sengine_sync_interval": os.getenv("SENGINE_SYNC_INTERVAL", 2.0),
+                "search_window_days": os.getenv("SEARCH_WINDOW_DAYS", 30) or None,
+                "search_half_life_days": os.getenv("SEARCH_HALF_LIFE_DAYS", 7) or None,
                 "logs_dir": os.getenv("LOGS_DIR"),
                 "log_level": os.getenv("LOG_LEVEL"),
+                "debug": os.getenv("DEBUG", False),
                 "dep_call_timeout": os.getenv("DEP_CALL_TIMEOUT", 10),
                 "dep_call_retry": os.getenv("DEP_CALL_RETRY", 10),
+                "dep_call_breaker_threshold": os.getenv(
+                    "DEP_CALL_BREAKER_THRESHOLD", 5
+                ),
+                "dep_call_breaker_reset": os.getenv("DEP_CALL_BREAKER_RESET", 30),
+                "dep_call_hedge": os.getenv("DEP_CALL_HEDGE", False),
+                "ledger_batch_size": os.getenv("LEDGER_BATCH_SIZE", 100),
+                "ledger_flush_interval": os.getenv("LEDGER_FLUSH_INTERVAL", 5.0),
+                "ledger_queue_size": os.getenv("LEDGER_QUEUE_SIZE", 10_000),
+                "analysis_model_tiers": os.getenv(
+                    "ANALYSIS_MODEL_TIERS", "3000=gpt-3.5-turbo"
+                ),
+                "counter_model_tiers": os.getenv(
+                    "COUNTER_MODEL_TIERS", "3000=gpt-3.5-turbo"
+                ),
+                "long_context_model": os.getenv(
+                    "LONG_CONTEXT_MODEL", "gpt-3.5-turbo-16k"
+                ),
+                "counter_mode": os.getenv("COUNTER_MODE", "single"),
+                "counter_workers": os.getenv("COUNTER_WORKERS", 4),
+                "analysis_workers": os.getenv("ANALYSIS_WORKERS", 8),
+                "analysis_pack_tokens": os.getenv("ANALYSIS_PACK_TOKENS", 6000),
+                "analysis_pack_max_items": os.getenv("ANALYSIS_PACK_MAX_ITEMS", 8),
+                "events_buffer_size": os.getenv("EVENTS_BUFFER_SIZE", 256),
+                "events_heartbeat": os.getenv("EVENTS_HEARTBEAT", 15.0),
+                "download_workers": os.getenv("DOWNLOAD_WORKERS", 16),
+                "extract_workers": os.getenv("EXTRACT_WORKERS", 0),
+                "extract_queue_size": os.getenv("EXTRACT_QUEUE_SIZE", 32),
+                "html_cache_dir": os.getenv("HTML_CACHE_DIR", "data/html_cache"),
+                "html_cache_ttl": os.getenv("HTML_CACHE_TTL", 7 * 24 * 60 * 60),
+                "html_cache_max_bytes": os.getenv(
+                    "HTML_CACHE_MAX_BYTES", 512 * 1024 * 1024
+                ),
+                "feed_fulltext_min_words": os.getenv("FEED_FULLTEXT_MIN_WORDS", 250),
+                "feed_fulltext_min_paragraphs": os.getenv(
+                    "FEED_FULLTEXT_MIN_PARAGRAPHS", 3
+                ),
+                "compress_min_bytes": os.getenv("COMPRESS_MIN_BYTES", 1024),
+                "workers": os.getenv("WORKERS", 1),
                 "host_name": os.getenv("HOST_NAME", "127.0.0.1"),
                 "port": os.getenv("PORT", 8000),
                 "browser_agent": os.getenv(
@@ -1,47 +1,91 @@
 import json
 import logging
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Tuple, Union
 
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Session
 
 import insightbeam.dal as dal
-from insightbeam.common import Article
+from insightbeam.common import Article, DailyUsage, SourceItem, SourceUsage
+from insightbeam.core.events import EventBus
 from insightbeam.engine.interpreter import (
     Analysis,
+    AnalysisStreamEvent,
     ArticleAnalysis,
+    CallOrigin,
     CounterAnalysis,
     Interpreter,
 )
 from insightbeam.engine.rssreader import RSSReader
-from insightbeam.engine.search import SearchEngine
+from insightbeam.engine.search import Input, SearchEngine
 
 _logger = logging.getLogger(__name__)
 
 
 def get_sources(session: Session):
-    return dal.get_all_sources(session)
+    return dal.get_all_source_rows(session)
 
 
 def add_source(session: Session, **kwargs):
     return dal.add_source(session, **kwargs)
 
 
-def pull_from_sources(source_id: int, reader: RSSReader, session: Session):
+def pull_from_sources(
+    source_id: int,
+    reader: RSSReader,
+    session: Session,
+    sengine: SearchEngine,
+    events: EventBus,
+):
     """
+    New items are stored in a single transaction and only handed to the search engine (and announced to event
+    subscribers) once it has committed.
+
     :raise NoResultFound: When source could not be found
     """
     source = dal.get_source(session, source_id)
 
-    current_items = dal.get_source_items(session, source.uuid)
-    (retrieved_items, failed) = reader.load_source_items(source.url)
+    current_titles = dal.get_source_item_titles(session, source.uuid)
+    (retrieved_items, failed, stats) = reader.load_source_items(source.url)
 
-    new_item_titles = set([itm.title for itm in retrieved_items]) - set(
-        [itm.title for itm in current_items]
-    )
+    new_item_titles = set([itm.title for itm in retrieved_items]) - current_titles
     new_items = [itm for itm in retrieved_items if itm.title in new_item_titles]
 
     _logger.info(f"pulled {len(new_items)} new documents!")
-    return (dal.add_source_items(session, source, new_items), failed)
+    added_items = dal.add_source_items(session, source, new_items)
+    sengine.add_documents(added_items, to_search_input)
+    for added_item in added_items:
+        events.item_created(added_item)
+    return (added_items, failed, stats)
+
+
+def get_source_stats(source_id: int, reader: RSSReader, session: Session):
+    """
+    :raise NoResultFound: When source could not be found
+    """
+    source = dal.get_source(session, source_id)
+    return reader.source_stats(source.url)
+
+
+def reprocess_cached_items(reader: RSSReader, session: Session) -> int:
+    """
+    Re-extract the stored source items from the cached html, no network access is made
+    """
+    (articles, failed) = reader.reprocess_cached()
+    if len(failed) > 0:
+        _logger.warning("Could not re-extract %s cached articles", len(failed))
+    return dal.update_source_item_contents(session, articles)
+
+
+def to_search_input(item: SourceItem) -> Input:
+    return Input(
+        uuid=str(item.uuid),
+        url=item.url,
+        title=item.title,
+        content=item.content or "",
+        published=item.published,
+    )
 
 
 def get_source_items(source_id: int, session: Session):
@@ -49,7 +93,7 @@ def get_source_items(source_id: int, session: Session):
     :raise NoResultFound: When source could not be found
     """
     dal.get_source(session, source_id)
-    return dal.get_source_items(session, source_id)
+    return dal.get_source_item_rows(session, source_id)
 
 
 def get_source_item(item_id: int, session: Session):
@@ -59,7 +103,23 @@ def get_source_item(item_id: int, session: Session):
     return dal.get_source_item(session, item_id)
 
 
-def get_source_item_analysis(item_id: int, session: Session, interpreter: Interpreter):
+def get_stored_source_item_analysis(item_id: int, session: Session) -> Union[str, None]:
+    """
+    The persisted analysis json, None when it has not been generated yet
+    """
+    return dal.get_source_item_analysis(session, item_id)
+
+
+def get_stored_source_item_counters(item_id: int, session: Session) -> Union[str, None]:
+    """
+    The persisted counter analysis json, None when it has not been generated yet
+    """
+    return dal.get_source_item_counter_analysis(session, item_id)
+
+
+def get_source_item_analysis(
+    item_id: int, session: Session, interpreter: Interpreter, events: EventBus
+):
     """
     :raise NoResultFound: When source item could not be found
     :raise RuntimeError: When there is an error generating the article analysis
@@ -70,22 +130,108 @@ def get_source_item_analysis(item_id: int, session: Session, interpreter: Interp
         source_item = dal.get_source_item(session, item_id)
 
         item = Article(
-            url=source_item.url, title=source_item.title, content=source_item.content
+            url=source_item.url,
+            title=source_item.title,
+            content=source_item.content or "",
         )
-        analysis = interpreter.analyze([item])[0]
+        origin = CallOrigin(
+            source_item_uuid=item_id, source_uuid=source_item.source_uuid
+        )
+        analysis = interpreter.analyze([item], [origin])[0]
 
         if analysis.error is not None or not isinstance(analysis.analysis, Analysis):
             error = analysis.error or "analysis is not of expected type [Analysis]"
             raise RuntimeError("Error generating analysis {error}".format(error=error))
 
-        dal.add_source_item_analysis(session, item_id, analysis)
+        analysis = dal.add_source_item_analysis(session, item_id, analysis)
+        events.analysis_ready(source_item, analysis)
     else:
         analysis = ArticleAnalysis(**json.loads(analysis_str))
     return analysis
 
 
+def analyze_source_items(
+    source_id: int,
+    limit: int,
+    session: Session,
+    interpreter: Interpreter,
+    events: EventBus,
+) -> Tuple[List[int], List[int]]:
+    """
+    Analyze the source's items that have no analysis yet, short items are packed several per call
+
+    :raise NoResultFound: When source could not be found
+    :return: The ids of the items analyzed and of those that failed
+    """
+    dal.get_source(session, source_id)
+    source_items = dal.get_unanalyzed_source_items(session, source_id, limit)
+    if not source_items:
+        return (list(), list())
+
+    items = [
+        Article(url=itm.url, title=itm.title, content=itm.content or "")
+        for itm in source_items
+    ]
+    origins = [
+        CallOrigin(source_item_uuid=itm.uuid, source_uuid=itm.source_uuid)
+        for itm in source_items
+    ]
+    analyzed = list()
+    failed = list()
+    for source_item, analysis in zip(source_items, interpreter.analyze(items, origins)):
+        if analysis.error is not None or not isinstance(analysis.analysis, Analysis):
+            failed.append(source_item.uuid)
+            continue
+        analysis = dal.add_source_item_analysis(session, source_item.uuid, analysis)
+        events.analysis_ready(source_item, analysis)
+        analyzed.append(source_item.uuid)
+    return (analyzed, failed)
+
+
+def stream_source_item_analysis(
+    item_id: int, session: Session, interpreter: Interpreter, events: EventBus
+) -> Iterator[AnalysisStreamEvent]:
+    """
+    :raise NoResultFound: When source item could not be found
+    """
+    analysis_str = dal.get_source_item_analysis(session, item_id)
+
+    if analysis_str is not None:
+        analysis = ArticleAnalysis(**json.loads(analysis_str))
+        return iter([AnalysisStreamEvent(event="analysis", analysis=analysis)])
+
+    source_item = dal.get_source_item(session, item_id)
+    item = Article(
+        url=source_item.url, title=source_item.title, content=source_item.content or ""
+    )
+    origin = CallOrigin(source_item_uuid=item_id, source_uuid=source_item.source_uuid)
+    return _persist_streamed_analysis(
+        source_item, session, interpreter.stream_analysis(item, origin), events
+    )
+
+
+def _persist_streamed_analysis(
+    source_item: SourceItem,
+    session: Session,
+    stream: Iterator[AnalysisStreamEvent],
+    events: EventBus,
+) -> Iterator[AnalysisStreamEvent]:
+    for event in stream:
+        if event.event == "analysis" and event.analysis is not None:
+            stored = dal.add_source_item_analysis(
+                session, source_item.uuid, event.analysis
+            )
+            event = event.model_copy(update={"analysis": stored})
+            events.analysis_ready(source_item, stored)
+        yield event
+
+
 def get_source_item_counters(
-    item_id: int, session: Session, interpreter: Interpreter, sengine: SearchEngine
+    item_id: int,
+    session: Session,
+    interpreter: Interpreter,
+    sengine: SearchEngine,
+    events: EventBus,
 ):
     """
     :raise NoResultFound: When base article analysis could not be found or associated articles cannot be found in the db
@@ -105,21 +251,33 @@ def get_source_item_counters(
         if article_analysis.analysis is None:
             raise RuntimeError("Article analysis was found but the analysis was empty")
 
-        similar_documents = sengine.search(article_analysis.analysis.subject)
+        source_item = dal.get_source_item(session, item_id)
+        similar_documents = sengine.search_item(
+            Input(
+                uuid=str(source_item.uuid),
+                url=source_item.url,
+                title=f"{source_item.title} {article_analysis.analysis.subject}",
+                content=source_item.content or "",
+                published=source_item.published,
+            )
+        )
         articles = list()
 
         for doc in similar_documents:
-            source_item = dal.get_source_item(session, item_id)
+            related_item = dal.get_source_item(session, int(doc.article_uuid))
             articles.append(
                 Article(
                     title=doc.article_title,
-                    content=source_item.content,
-                    url=source_item.url,
+                    content=related_item.content or "",
+                    url=related_item.url,
                 )
             )
 
         counter_analysis = interpreter.counter_analysis(
-            article_analysis.article_url, article_analysis.analysis, articles
+            article_analysis.article_url,
+            article_analysis.analysis,
+            articles,
+            CallOrigin(source_item_uuid=item_id, source_uuid=source_item.source_uuid),
         )
 
         if counter_analysis.error is not None or not isinstance(
@@ -131,7 +289,22 @@ def get_source_item_counters(
             )
             raise RuntimeError("Error generating analysis {error}".format(error=error))
 
-        dal.add_source_item_counter_analysis(session, item_id, counter_analysis)
+        counter_analysis = dal.add_source_item_counter_analysis(
+            session, item_id, counter_analysis
+        )
+        events.counters_ready(source_item, counter_analysis)
     else:
         counter_analysis = ArticleAnalysis(**json.loads(counter_analysis_str))
     return counter_analysis
+
+
+def _usage_since(days: int) -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+
+
+def get_usage_by_source(session: Session, days: int) -> List[SourceUsage]:
+    return dal.get_usage_by_source(session, _usage_since(days))
+
+
+def get_usage_by_day(session: Session, days: int) -> List[DailyUsage]:
+    return dal.get_usage_by_day(session, _usage_since(days))
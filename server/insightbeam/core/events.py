@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import deque
+from typing import Deque, List, Set, Tuple, Union
+
+from pydantic import BaseModel
+
+from insightbeam.common import SourceItem
+from insightbeam.engine.interpreter import ArticleAnalysis
+
+
+class Event(BaseModel):
+    event: str
+    source_uuid: int
+    item_uuid: int
+    # `item_created` carries the item (without its content), `analysis_ready` and `counters_ready` the analysis
+    item: Union[SourceItem, None] = None
+    analysis: Union[ArticleAnalysis, None] = None
+
+
+class Subscription:
+    """
+    Events published to one subscriber, buffered until it reads them. The buffer is bounded, once full the
+    oldest events are dropped and counted so the subscriber can tell it missed some.
+    """
+
+    _sources: Union[Set[int], None]
+    _buffer: Deque[Event]
+    _lock: threading.Lock
+    _loop: asyncio.AbstractEventLoop
+    _ready: asyncio.Event
+    _dropped: int
+
+    def __init__(
+        self,
+        sources: Union[Set[int], None],
+        buffer_size: int,
+        loop: asyncio.AbstractEventLoop,
+    ):
+        self._sources = sources
+        self._buffer = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._loop = loop
+        self._ready = asyncio.Event()
+        self._dropped = 0
+
+    def wants(self, event: Event) -> bool:
+        return self._sources is None or event.source_uuid in self._sources
+
+    def put(self, event: Event):
+        """
+        Called from any thread, never blocks the publisher
+        """
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self._dropped += 1
+            self._buffer.append(event)
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # The subscriber's event loop has been closed
+            pass
+
+    async def get(self, timeout: float) -> Tuple[List[Event], int]:
+        """
+        The buffered events and how many were dropped since the last call, waiting up to `timeout` seconds for
+        an event when there are none
+        """
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._ready.clear()
+        with self._lock:
+            events = list(self._buffer)
+            dropped = self._dropped
+            self._buffer.clear()
+            self._dropped = 0
+        return (events, dropped)
+
+
+class EventBus:
+    """
+    In-process publish/subscribe of item and analysis events, every worker only sees the events of the
+    requests it served.
+    """
+
+    _buffer_size: int
+    _subscriptions: List[Subscription]
+    _lock: threading.Lock
+
+    def __init__(self, buffer_size: int):
+        self._buffer_size = buffer_size
+        self._subscriptions = list()
+        self._lock = threading.Lock()
+
+    def subscribe(self, sources: Union[Set[int], None] = None) -> Subscription:
+        """
+        Must be called from the event loop the subscription is read on
+
+        :param sources: Only receive the events of these sources, every source when None
+        """
+        subscription = Subscription(
+            sources, self._buffer_size, asyncio.get_running_loop()
+        )
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, event: Event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.wants(event):
+                subscription.put(event)
+
+    def item_created(self, item: SourceItem):
+        self.publish(
+            Event(
+                event="item_created",
+                source_uuid=item.source_uuid,
+                item_uuid=item.uuid,
+                item=item.model_copy(update={"content": None}),
+            )
+        )
+
+    def analysis_ready(self, item: SourceItem, analysis: ArticleAnalysis):
+        self.publish(
+            Event(
+                event="analysis_ready",
+                source_uuid=item.source_uuid,
+                item_uuid=item.uuid,
+                analysis=analysis,
+            )
+        )
+
+    def counters_ready(self, item: SourceItem, analysis: ArticleAnalysis):
+        self.publish(
+            Event(
+                event="counters_ready",
+                source_uuid=item.source_uuid,
+                item_uuid=item.uuid,
+                analysis=analysis,
+            )
+        )
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import threading
+from typing import Dict, List
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+import insightbeam.dal as dal
+from insightbeam.dependency_manager import DependencyManager
+
+
+class Readiness:
+    """
+    Tracks whether a worker should receive traffic. A worker is live as soon as it serves requests, it is ready
+    once every engine has been built, the search index has been primed and the database answers.
+    """
+
+    _manager: DependencyManager
+    _dependencies: List[type]
+    _primed: threading.Event
+
+    def __init__(self, manager: DependencyManager, dependencies: List[type]):
+        self._manager = manager
+        self._dependencies = dependencies
+        self._primed = threading.Event()
+
+    def mark_primed(self):
+        self._primed.set()
+
+    def state(self, session: Session) -> ReadinessState:
+        dependencies = {
+            dependency.__name__: self._manager.is_built(dependency)
+            for dependency in self._dependencies
+        }
+        index_primed = self._primed.is_set()
+        database = dal.is_reachable(session)
+        return ReadinessState(
+            ready=all(dependencies.values()) and index_primed and database,
+            dependencies=dependencies,
+            index_primed=index_primed,
+            database=database,
+        )
+
+
+class ReadinessState(BaseModel):
+    ready: bool
+    dependencies: Dict[str, bool]
+    index_primed: bool
+    database: bool
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Union
+
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session
+
+import insightbeam.dal as dal
+from insightbeam.config import Configuration
+from insightbeam.core import to_search_input
+from insightbeam.engine.election import LeaderLock
+from insightbeam.engine.search import SearchEngine
+
+_logger = logging.getLogger(__name__)
+
+
+class IndexSynchronizer:
+    """
+    Keeps the search index of a multi worker deployment in line with the database.
+
+    Only the worker holding the leader lock writes the index, it indexes every source item stored after the
+    last one it has indexed, whichever worker pulled it. The other workers search the index read-only, pick up
+    the writer's new generations and take over the writing when the writer's process goes away.
+    """
+
+    _cfg: Configuration
+    _sengine: SearchEngine
+    _leader: LeaderLock
+    _db_engine: Engine
+    _last_uuid: Union[int, None]
+    _stopped: threading.Event
+    _synced: threading.Event
+    _thread: threading.Thread
+
+    def __init__(
+        self,
+        cfg: Configuration,
+        sengine: SearchEngine,
+        leader: LeaderLock,
+        db_engine: Engine,
+    ):
+        self._cfg = cfg
+        self._sengine = sengine
+        self._leader = leader
+        self._db_engine = db_engine
+        self._last_uuid = None
+        self._stopped = threading.Event()
+        self._synced = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="index-sync", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def wait_synced(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Wait for the first pass, after it the index holds (or has been handed) every stored source item
+        """
+        return self._synced.wait(timeout)
+
+    def stop(self, timeout: Union[float, None] = None):
+        self._stopped.set()
+        self._thread.join(timeout)
+        self._sengine.close(timeout)
+        self._leader.release()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.sync()
+                self._synced.set()
+            except Exception as e:
+                _logger.error("Exception synchronizing the search index %s", e)
+            self._stopped.wait(self._cfg.sengine_sync_interval)
+
+    def sync(self):
+        if self._sengine.read_only:
+            if not self._leader.try_acquire():
+                self._sengine.refresh()
+                return
+            _logger.info("Took over writing the search index")
+            self._sengine.promote(self._cfg)
+
+        if self._last_uuid is None:
+            self._last_uuid = max(
+                (int(uuid) for uuid in self._sengine.indexed_uuids()), default=0
+            )
+
+        with Session(self._db_engine) as session:
+            for items in dal.iter_source_items_with_content(
+                session, after_uuid=self._last_uuid
+            ):
+                self._sengine.add_documents(items, to_search_input)
+                self._last_uuid = items[-1].uuid
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import logging
+from typing import List, Union
+
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session
+
+import insightbeam.dal as dal
+from insightbeam.common import LlmCall
+from insightbeam.common.batching import BatchWriter
+from insightbeam.config import Configuration
+
+_logger = logging.getLogger(__name__)
+
+
+class UsageLedger:
+    """
+    Keeps every chat model call in the `llm_call` table.
+
+    `record` only enqueues the call, a background writer inserts them in batches so the interpreter never waits
+    on the database. When the queue is full (the database has been unavailable for a while) calls are dropped
+    rather than holding up the request.
+    """
+
+    _db_engine: Engine
+    _writer: BatchWriter[LlmCall]
+    _dropped: int
+
+    def __init__(self, cfg: Configuration, db_engine: Engine):
+        self._db_engine = db_engine
+        self._dropped = 0
+        self._writer = BatchWriter(
+            self._commit,
+            batch_size=cfg.ledger_batch_size,
+            flush_interval=cfg.ledger_flush_interval,
+            queue_size=cfg.ledger_queue_size,
+            name="usage-ledger",
+        )
+
+    def record(self, call: LlmCall):
+        try:
+            if self._writer.put([call], block=False) == 0:
+                self._dropped += 1
+                _logger.warning(
+                    "Usage ledger queue is full, %s calls dropped", self._dropped
+                )
+        except RuntimeError:
+            # Closed while shutting down
+            pass
+
+    def flush(self, timeout: Union[float, None] = None) -> bool:
+        return self._writer.flush(timeout)
+
+    def close(self, timeout: Union[float, None] = None):
+        self._writer.close(timeout)
+
+    def _commit(self, calls: List[LlmCall]):
+        with Session(self._db_engine) as session:
+            dal.add_llm_calls(session, calls)
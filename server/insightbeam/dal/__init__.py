@@ -1,12 +1,37 @@
+import datetime
 import logging
-from typing import Any, List, Union
-
-from sqlalchemy import Engine, Select, create_engine, select
+import zlib
+from typing import Any, Dict, Iterator, List, Set, Tuple, Type, Union
+
+from sqlalchemy import (
+    Connection,
+    Engine,
+    MetaData,
+    Select,
+    create_engine,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import Session
-
-from insightbeam.common import Article, Source, SourceItem
+from sqlalchemy.schema import CreateTable
+
+from insightbeam.common import (
+    Article,
+    DailyUsage,
+    LlmCall,
+    Source,
+    SourceItem,
+    SourceUsage,
+    Usage,
+)
 from insightbeam.config import Configuration
 from insightbeam.dal.schemas import Base
+from insightbeam.dal.schemas import LlmCall as DbLlmCall
 from insightbeam.dal.schemas import Source as DbSource
 from insightbeam.dal.schemas import SourceItem as DbSourceItem
 from insightbeam.dal.schemas import SourceItemAnalysis as DbSourceItemAnalysis
@@ -16,6 +41,9 @@ from insightbeam.dal.schemas import (
 from insightbeam.engine.interpreter import ArticleAnalysis
 
 _logger = logging.getLogger(__name__)
+_content_compression_level = 6
+# Rows per executemany round trip when inserting source items
+_insert_batch_size = 500
 
 
 def get_all_sources(session: Session) -> List[Source]:
@@ -23,6 +51,39 @@ def get_all_sources(session: Session) -> List[Source]:
     return [Source(uuid=uuid, url=url) for (uuid, url) in results]
 
 
+def _plain_rows(session: Session, stmt: Select[Any]) -> List[Dict[str, Any]]:
+    """
+    The rows of `stmt` as dicts keyed by column label, read straight off the DBAPI cursor without building a
+    `Row` per result. Only the columns whose type needs it on this database (e.g. datetimes stored as text by
+    SQLite) go through their result processor.
+    """
+    dialect = session.get_bind().dialect
+    processors = list()
+    for i, column in enumerate(stmt.selected_columns):
+        processor = column.type.dialect_impl(dialect).result_processor(dialect, None)
+        if processor is not None:
+            processors.append((i, processor))
+    result = session.connection().execute(stmt)
+    keys = tuple(result.keys())
+    try:
+        rows = result.cursor.fetchall()
+        if processors:
+            rows = [list(row) for row in rows]
+            for row in rows:
+                for i, processor in processors:
+                    row[i] = processor(row[i])
+        return [dict(zip(keys, row)) for row in rows]
+    finally:
+        result.close()
+
+
+def get_all_source_rows(session: Session) -> List[Dict[str, Any]]:
+    """
+    `get_all_sources` as plain dicts shaped like `Source`, for serializing without validation
+    """
+    return _plain_rows(session, select(DbSource.uuid, DbSource.url))
+
+
 def add_source(session: Session, **kwargs) -> Source:
     source = DbSource(**kwargs)
     session.add(source)
@@ -40,77 +101,241 @@ def get_source(session: Session, source_id: int) -> Source:
     return Source(uuid=source_uuid, url=url)
 
 
+def _encode_content(content: str) -> Tuple[bytes, str]:
+    return (zlib.compress(content.encode("utf-8"), _content_compression_level), "zlib")
+
+
+def _decode_content(raw: Union[str, bytes], codec: Union[str, None]) -> str:
+    """
+    raise: ValueError: When the row was written with an unknown codec
+    """
+    if codec is None:
+        return raw if isinstance(raw, str) else raw.decode("utf-8")
+    elif codec == "zlib" and isinstance(raw, bytes):
+        return zlib.decompress(raw).decode("utf-8")
+    else:
+        raise ValueError(f"Unsupported content codec [{codec}]")
+
+
 def get_source_items(
     session: Session, source_id: Union[int, None] = None
 ) -> List[SourceItem]:
+    """
+    Source items without their content, use `get_source_item` to load the content
+    """
+    stmt: Select[Any] = select(
+        DbSourceItem.uuid,
+        DbSourceItem.title,
+        DbSourceItem.url,
+        DbSourceItem.source_uuid,
+        DbSourceItem.published,
+    )
     if source_id is not None:
-        stmt: Select[Any] = select(
-            DbSourceItem.uuid,
-            DbSourceItem.title,
-            DbSourceItem.content,
-            DbSourceItem.url,
-            DbSourceItem.source_uuid,
-        ).where(DbSourceItem.source_uuid == source_id)
-    else:
-        stmt = select(DbSourceItem.uuid, DbSourceItem.title)
+        stmt = stmt.where(DbSourceItem.source_uuid == source_id)
 
     results = session.execute(stmt)
     return [
         SourceItem(
-            uuid=uuid, title=title, content=content, url=url, source_uuid=source_uuid
+            uuid=uuid,
+            title=title,
+            url=url,
+            source_uuid=source_uuid,
+            published=published,
         )
-        for (uuid, title, content, url, source_uuid) in results
+        for (uuid, title, url, source_uuid, published) in results
     ]
 
 
+def get_source_item_rows(
+    session: Session, source_id: Union[int, None] = None
+) -> List[Dict[str, Any]]:
+    """
+    `get_source_items` as plain dicts shaped like `SourceItem`, for serializing without validation
+    """
+    stmt: Select[Any] = select(
+        DbSourceItem.uuid,
+        DbSourceItem.title,
+        DbSourceItem.url,
+        DbSourceItem.source_uuid,
+        DbSourceItem.published,
+    )
+    if source_id is not None:
+        stmt = stmt.where(DbSourceItem.source_uuid == source_id)
+    return _plain_rows(session, stmt)
+
+
+def get_source_item_titles(session: Session, source_id: int) -> Set[str]:
+    results = session.execute(
+        select(DbSourceItem.title).where(DbSourceItem.source_uuid == source_id)
+    )
+    return set(title for (title,) in results)
+
+
+def iter_source_items_with_content(
+    session: Session, batch_size: int = 500, after_uuid: int = 0
+) -> Iterator[List[SourceItem]]:
+    """
+    Stream every source item including its content in batches of `batch_size`, in insertion order starting
+    after `after_uuid`
+    """
+    results = session.execute(
+        select(
+            DbSourceItem.uuid,
+            DbSourceItem.title,
+            DbSourceItem.url,
+            DbSourceItem.source_uuid,
+            DbSourceItem.published,
+            DbSourceItem.content,
+            DbSourceItem.content_codec,
+        )
+        .where(DbSourceItem.uuid > after_uuid)
+        .order_by(DbSourceItem.uuid)
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in results.partitions():
+        yield [
+            SourceItem(
+                uuid=uuid,
+                title=title,
+                url=url,
+                source_uuid=source_uuid,
+                published=published,
+                content=_decode_content(content, codec),
+            )
+            for (uuid, title, url, source_uuid, published, content, codec) in partition
+        ]
+
+
 def add_source_items(
     session: Session, source: Source, articles: List[Article]
 ) -> List[SourceItem]:
-    db_items = [
-        DbSourceItem(
-            title=a.title, content=a.content, url=a.url, source_uuid=source.uuid
+    """
+    Insert every article in a single transaction, the generated ids come back through RETURNING rather than
+    refreshing each ORM instance. Articles without a publication date are dated by the time they are added.
+    """
+    added: List[SourceItem] = list()
+    pulled_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    for start in range(0, len(articles), _insert_batch_size):
+        batch = articles[start : start + _insert_batch_size]  # noqa: E203
+        rows = list()
+        for a in batch:
+            (content, codec) = _encode_content(a.content)
+            rows.append(
+                {
+                    "title": a.title,
+                    "url": a.url,
+                    "source_uuid": source.uuid,
+                    "published": a.published or pulled_at,
+                    "content_codec": codec,
+                    "content": content,
+                }
+            )
+
+        uuids = session.scalars(
+            insert(DbSourceItem).returning(
+                DbSourceItem.uuid, sort_by_parameter_order=True
+            ),
+            rows,
+        ).all()
+        added.extend(
+            SourceItem(
+                uuid=uuid,
+                title=a.title,
+                content=a.content,
+                url=a.url,
+                source_uuid=source.uuid,
+                published=a.published or pulled_at,
+            )
+            for (uuid, a) in zip(uuids, batch)
         )
-        for a in articles
-    ]
 
-    session.add_all(db_items)
     session.commit()
+    return added
 
-    return [
-        SourceItem(
-            uuid=itm.uuid,
-            title=itm.title,
-            content=itm.content,
-            url=itm.url,
-            source_uuid=source.uuid,
+
+def update_source_item_contents(session: Session, articles: List[Article]) -> int:
+    """
+    Replace the content of the source items stored under each article url, returns the rows updated
+    """
+    updated = 0
+    for a in articles:
+        (content, codec) = _encode_content(a.content)
+        result = session.execute(
+            update(DbSourceItem)
+            .where(DbSourceItem.url == a.url)
+            .values(content=content, content_codec=codec)
         )
-        for itm in db_items
-    ]
+        updated += result.rowcount
+    session.commit()
+    return updated
 
 
 def get_source_item(session: Session, source_item_id: int) -> SourceItem:
     """
     raise: NoResultFound: When a SourceItem cannot be found for the given source_item_id
     """
-    (uuid, title, content, url, source_uuid) = session.execute(
+    (uuid, title, url, source_uuid, published, content, codec) = session.execute(
         select(
             DbSourceItem.uuid,
             DbSourceItem.title,
-            DbSourceItem.content,
             DbSourceItem.url,
             DbSourceItem.source_uuid,
+            DbSourceItem.published,
+            DbSourceItem.content,
+            DbSourceItem.content_codec,
         ).where(DbSourceItem.uuid == source_item_id)
     ).one()
 
     return SourceItem(
         uuid=uuid,
         title=title,
-        content=content,
+        content=_decode_content(content, codec),
         url=url,
         source_uuid=source_uuid,
+        published=published,
     )
 
 
+def get_unanalyzed_source_items(
+    session: Session, source_id: int, limit: int
+) -> List[SourceItem]:
+    """
+    The oldest `limit` items of the source without an analysis, including their content
+    """
+    results = session.execute(
+        select(
+            DbSourceItem.uuid,
+            DbSourceItem.title,
+            DbSourceItem.url,
+            DbSourceItem.source_uuid,
+            DbSourceItem.published,
+            DbSourceItem.content,
+            DbSourceItem.content_codec,
+        )
+        .outerjoin(
+            DbSourceItemAnalysis,
+            DbSourceItemAnalysis.source_item_uuid == DbSourceItem.uuid,
+        )
+        .where(
+            DbSourceItem.source_uuid == source_id,
+            DbSourceItemAnalysis.uuid.is_(None),
+        )
+        .order_by(DbSourceItem.uuid)
+        .limit(limit)
+    )
+    return [
+        SourceItem(
+            uuid=uuid,
+            title=title,
+            url=url,
+            source_uuid=source_uuid,
+            published=published,
+            content=_decode_content(content, codec),
+        )
+        for (uuid, title, url, source_uuid, published, content, codec) in results
+    ]
+
+
 def get_source_item_analysis(session: Session, source_item_id: int) -> Union[str, None]:
     row = session.execute(
         select(DbSourceItemAnalysis.analysis).where(
@@ -124,16 +349,44 @@ def get_source_item_analysis(session: Session, source_item_id: int) -> Union[str
     return None
 
 
+def _add_analysis_once(
+    session: Session,
+    table: Union[Type[DbSourceItemAnalysis], Type[DbSourceItemCounterAnalysis]],
+    source_item_id: int,
+    analysis: ArticleAnalysis,
+) -> ArticleAnalysis:
+    """
+    Insert the analysis unless the item already has one, the unique `source_item_uuid` rejects the loser of a
+    race on any database. Returns the analysis stored for the item.
+    """
+    try:
+        session.execute(
+            insert(table).values(
+                analysis=analysis.model_dump_json(), source_item_uuid=source_item_id
+            )
+        )
+        session.commit()
+        return analysis
+    except IntegrityError:
+        session.rollback()
+
+    stored = session.execute(
+        select(table.analysis).where(table.source_item_uuid == source_item_id)
+    ).scalar_one()
+    return ArticleAnalysis.model_validate_json(stored)
+
+
 def add_source_item_analysis(
     session: Session, source_item_id: int, analysis: ArticleAnalysis
-) -> None:
-    analysis_item = DbSourceItemAnalysis(
-        analysis=analysis.model_dump_json(), source_item_uuid=source_item_id
+) -> ArticleAnalysis:
+    """
+    Idempotent, when the item already has an analysis (e.g. generated by a concurrent request) it is kept and
+    returned instead
+    """
+    return _add_analysis_once(
+        session, DbSourceItemAnalysis, source_item_id, analysis
     )
 
-    session.add(analysis_item)
-    session.commit()
-
 
 def get_source_item_counter_analysis(
     session: Session, source_item_id: int
@@ -153,15 +406,93 @@ def get_source_item_counter_analysis(
 
 def add_source_item_counter_analysis(
     session: Session, source_item_id: int, analysis: ArticleAnalysis
-) -> None:
-    analysis_item = DbSourceItemCounterAnalysis(
-        analysis=analysis.model_dump_json(), source_item_uuid=source_item_id
+) -> ArticleAnalysis:
+    """
+    Idempotent, when the item already has a counter analysis it is kept and returned instead
+    """
+    return _add_analysis_once(
+        session, DbSourceItemCounterAnalysis, source_item_id, analysis
     )
 
-    session.add(analysis_item)
+
+def add_llm_calls(session: Session, calls: List[LlmCall]) -> None:
+    session.execute(insert(DbLlmCall), [call.model_dump() for call in calls])
     session.commit()
 
 
+def _usage_by(session: Session, key: Any, since: datetime.datetime) -> Dict[Any, Usage]:
+    """
+    Token totals and the (nearest rank) p95 latency of the calls made since `since`, grouped by `key`
+    """
+    totals = session.execute(
+        select(
+            key,
+            func.count(),
+            func.coalesce(func.sum(DbLlmCall.prompt_tokens), 0),
+            func.coalesce(func.sum(DbLlmCall.completion_tokens), 0),
+            func.avg(DbLlmCall.prompt_tokens),
+        )
+        .where(DbLlmCall.created_at >= since)
+        .group_by(key)
+    ).all()
+
+    ranked = (
+        select(
+            key.label("key"),
+            DbLlmCall.latency_ms,
+            func.row_number()
+            .over(partition_by=key, order_by=DbLlmCall.latency_ms)
+            .label("rank"),
+            func.count().over(partition_by=key).label("calls"),
+        )
+        .where(DbLlmCall.created_at >= since)
+        .subquery()
+    )
+    p95: Dict[Any, float] = {
+        group: latency_ms
+        for (group, latency_ms) in session.execute(
+            select(ranked.c.key, ranked.c.latency_ms).where(
+                ranked.c.rank == (ranked.c.calls * 95 + 99) // 100
+            )
+        )
+    }
+
+    return {
+        group: Usage(
+            calls=calls,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            avg_prompt_tokens=avg_prompt_tokens,
+            p95_latency_ms=p95.get(group),
+        )
+        for (
+            group,
+            calls,
+            prompt_tokens,
+            completion_tokens,
+            avg_prompt_tokens,
+        ) in totals
+    }
+
+
+def get_usage_by_source(
+    session: Session, since: datetime.datetime
+) -> List[SourceUsage]:
+    usage = _usage_by(session, DbLlmCall.source_uuid, since)
+    return [
+        SourceUsage(source_uuid=source_uuid, **totals.model_dump())
+        for (source_uuid, totals) in usage.items()
+    ]
+
+
+def get_usage_by_day(session: Session, since: datetime.datetime) -> List[DailyUsage]:
+    usage = _usage_by(session, func.date(DbLlmCall.created_at), since)
+    return [
+        DailyUsage(day=day, **totals.model_dump())
+        for (day, totals) in sorted(usage.items())
+    ]
+
+
 def initialize_engine(cfg: Configuration):
     engine = create_engine(cfg.db_url, echo=True)
     table_names = [
@@ -169,6 +500,7 @@ def initialize_engine(cfg: Configuration):
         DbSourceItem.__tablename__,
         DbSourceItemAnalysis.__tablename__,
         DbSourceItemCounterAnalysis.__tablename__,
+        DbLlmCall.__tablename__,
     ]
 
     with engine.connect() as conn:
@@ -182,9 +514,153 @@ def initialize_engine(cfg: Configuration):
             conn.commit()
         else:
             _logger.info("Some tables already created!")
+            _migrate(engine)
     return engine
 
 
+def _migrate(engine: Engine):
+    """
+    Create the tables and add the columns introduced after the database was first created
+    """
+    Base.metadata.create_all(engine)
+    added_columns = {
+        DbSourceItem.__tablename__: {
+            "content_codec": "VARCHAR",
+            "published": "DATETIME",
+        },
+        DbLlmCall.__tablename__: {
+            "routed_tokens": "INTEGER",
+        },
+    }
+    added_indexes = {
+        DbSourceItem.__tablename__: ["published"],
+    }
+    # One analysis per item, duplicates left by earlier races are dropped keeping the first one
+    unique_columns = {
+        DbSourceItemAnalysis.__tablename__: "source_item_uuid",
+        DbSourceItemCounterAnalysis.__tablename__: "source_item_uuid",
+    }
+
+    with engine.connect() as conn:
+        for table_name, columns in added_columns.items():
+            existing = set(c["name"] for c in inspect(conn).get_columns(table_name))
+            for column_name, ddl in columns.items():
+                if column_name not in existing:
+                    _logger.info("Adding column [%s.%s]", table_name, column_name)
+                    conn.execute(
+                        text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {ddl}")
+                    )
+
+        rebuilt = _rebuild_source_items(conn)
+
+        for table_name, column_names in added_indexes.items():
+            for column_name in column_names:
+                conn.execute(
+                    text(
+                        f"CREATE INDEX IF NOT EXISTS ix_{table_name}_{column_name} "
+                        f"ON {table_name} ({column_name})"
+                    )
+                )
+
+        for table_name, column_name in unique_columns.items():
+            inspector = inspect(conn)
+            unique = [
+                u["column_names"] for u in inspector.get_unique_constraints(table_name)
+            ] + [
+                i["column_names"]
+                for i in inspector.get_indexes(table_name)
+                if i["unique"]
+            ]
+            if [column_name] not in unique:
+                _logger.info("Adding unique index [%s.%s]", table_name, column_name)
+                conn.execute(
+                    text(
+                        f"DELETE FROM {table_name} WHERE uuid NOT IN "
+                        f"(SELECT MIN(uuid) FROM {table_name} GROUP BY {column_name})"
+                    )
+                )
+                conn.execute(
+                    text(
+                        f"CREATE UNIQUE INDEX uq_{table_name}_{column_name} "
+                        f"ON {table_name} ({column_name})"
+                    )
+                )
+        conn.commit()
+
+    if rebuilt:
+        # Hand the pages freed by the compression back to the file system
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+
+
+def _rebuild_source_items(conn: Connection) -> bool:
+    """
+    Copy `source_item` into a table with the current column order when `content` is not its last column (the
+    columns added by `_migrate` come after it) or some rows are still plain text, compressing their content on
+    the way. Returns whether the table was rebuilt.
+    """
+    table_name = DbSourceItem.__tablename__
+    columns = [c["name"] for c in inspect(conn).get_columns(table_name)]
+    plain_rows = conn.execute(
+        select(func.count())
+        .select_from(DbSourceItem)
+        .where(DbSourceItem.content_codec.is_(None))
+    ).scalar_one()
+    if columns[-1] == "content" and plain_rows == 0:
+        return False
+
+    _logger.info(
+        "Rebuilding table [%s], compressing the content of %s rows",
+        table_name,
+        plain_rows,
+    )
+    # The referenced tables come along so the foreign keys resolve
+    metadata = MetaData()
+    Base.metadata.tables[DbSource.__tablename__].to_metadata(metadata)
+    new_table = Base.metadata.tables[table_name].to_metadata(
+        metadata, name=f"{table_name}_rebuild"
+    )
+    conn.execute(CreateTable(new_table))
+    old_table = Base.metadata.tables[table_name]
+    last_uuid = 0
+    while True:
+        rows = (
+            conn.execute(
+                select(old_table)
+                .where(old_table.c.uuid > last_uuid)
+                .order_by(old_table.c.uuid)
+                .limit(_insert_batch_size)
+            )
+            .mappings()
+            .all()
+        )
+        if not rows:
+            break
+        batch = list()
+        for row in rows:
+            row = dict(row)
+            if row["content_codec"] is None:
+                (row["content"], row["content_codec"]) = _encode_content(
+                    _decode_content(row["content"], None)
+                )
+            batch.append(row)
+        conn.execute(insert(new_table), batch)
+        last_uuid = rows[-1]["uuid"]
+
+    conn.execute(text(f"DROP TABLE {table_name}"))
+    conn.execute(text(f"ALTER TABLE {new_table.name} RENAME TO {table_name}"))
+    return True
+
+
+def is_reachable(session: Session) -> bool:
+    try:
+        session.execute(text("SELECT 1"))
+        return True
+    except SQLAlchemyError as e:
+        _logger.warning("Database is not reachable %s", e)
+        return False
+
+
 def get_session_supplier(engine: Engine):
     def session_supplier(engine: Engine):
         try:
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
-from sqlalchemy import ForeignKey
+from datetime import datetime
+from typing import Union
+
+from sqlalchemy import ForeignKey, LargeBinary
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -24,9 +27,16 @@ class SourceItem(Base):
 
     uuid: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str]
-    content: Mapped[str]
     url: Mapped[str]
     source_uuid: Mapped[int] = mapped_column(ForeignKey("source.uuid"))
+    # Publication date of the feed entry (the time it was pulled when the feed has none), NULL for rows written
+    # before it was kept
+    published: Mapped[Union[datetime, None]] = mapped_column(index=True)
+    # NULL for rows written before content compression, their content is plain text
+    content_codec: Mapped[Union[str, None]]
+    # Kept as the last column so reading the other columns never walks the content overflow pages, tables
+    # created before are rebuilt in this order by the migration
+    content: Mapped[bytes] = mapped_column(LargeBinary, deferred=True)
 
     source: Mapped[Source] = relationship(back_populates="source_items")
     analysis: Mapped[SourceItemAnalysis] = relationship(back_populates="source_item")
@@ -40,7 +50,10 @@ class SourceItemAnalysis(Base):
 
     uuid: Mapped[int] = mapped_column(primary_key=True)
     analysis: Mapped[str]
-    source_item_uuid: Mapped[int] = mapped_column(ForeignKey("source_item.uuid"))
+    # Unique so concurrent requests for the same item cannot store two analyses
+    source_item_uuid: Mapped[int] = mapped_column(
+        ForeignKey("source_item.uuid"), unique=True
+    )
 
     source_item: Mapped[SourceItem] = relationship(back_populates="analysis")
 
@@ -50,6 +63,30 @@ class SourceItemCounterAnalysis(Base):
 
     uuid: Mapped[int] = mapped_column(primary_key=True)
     analysis: Mapped[str]
-    source_item_uuid: Mapped[int] = mapped_column(ForeignKey("source_item.uuid"))
+    source_item_uuid: Mapped[int] = mapped_column(
+        ForeignKey("source_item.uuid"), unique=True
+    )
 
     source_item: Mapped[SourceItem] = relationship(back_populates="counter_analysis")
+
+
+class LlmCall(Base):
+    """
+    Usage ledger, one row per chat model call. The item and source are kept as plain ids (no foreign keys) so
+    the ledger outlives the rows it refers to.
+    """
+
+    __tablename__ = "llm_call"
+
+    uuid: Mapped[int] = mapped_column(primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(index=True)
+    operation: Mapped[str]
+    model: Mapped[str]
+    routed_tokens: Mapped[Union[int, None]]
+    prompt_tokens: Mapped[Union[int, None]]
+    completion_tokens: Mapped[Union[int, None]]
+    latency_ms: Mapped[float]
+    retries: Mapped[int]
+    outcome: Mapped[str]
+    source_item_uuid: Mapped[Union[int, None]]
+    source_uuid: Mapped[Union[int, None]] = mapped_column(index=True)
@@ -1,11 +1,14 @@
-from typing import Any, Callable, Dict, Generator, Union
+import threading
+from typing import Any, Callable, Dict, Generator, Iterator, Set, Union
 
 
 class DependencyManager:
     _deps: Dict
+    _built: Set[str]
 
     def __init__(self):
         self._deps = dict()
+        self._built = set()
 
     def register(
         self,
@@ -17,21 +20,59 @@ class DependencyManager:
         if named is None and isinstance(instance, type):
             type_: type = instance
             self._deps[type_.__name__] = supplier_func
+            self._built.add(type_.__name__)
         elif named is None:
             self._deps[type(instance).__name__] = supplier_func
+            self._built.add(type(instance).__name__)
         else:
             self._deps[named] = supplier_func
+            self._built.add(named)
 
-    def inject(self, class_: type) -> Callable[[], Any]:
-        def injector(class_name: str):
-            instance = self._deps[class_name]()
+    def register_lazy(self, class_: type, factory: Callable[[], Any]):
+        """
+        Register a single instance of `class_` that is only built by `factory` when it is first injected,
+        concurrent first injections wait for the same instance.
+        """
+        name = class_.__name__
+        instance: Any = None
+        lock = threading.Lock()
+
+        def supplier():
+            nonlocal instance
+            if instance is None:
+                with lock:
+                    if instance is None:
+                        instance = factory()
+                        self._built.add(name)
+            return instance
+
+        self._deps[name] = supplier
+        self._built.discard(name)
+
+    def is_built(self, class_: type) -> bool:
+        return class_.__name__ in self._built
+
+    def get(self, class_: type) -> Any:
+        """
+        The instance of `class_` outside of a request, suppliers yielding a scoped instance are not supported
+        """
+        return self._deps[class_.__name__]()
+
+    def inject(self, class_: type) -> Callable[[], Iterator[Any]]:
+        """
+        FastAPI dependency of `class_`, the remainder of a generator supplier (e.g. closing a session) runs once
+        the request is done
+        """
+
+        def injector():
+            instance = self._deps[class_.__name__]()
 
             if isinstance(instance, Generator):
-                return next(instance)
+                yield from instance
             else:
-                return instance
+                yield instance
 
-        return lambda: injector(class_.__name__)
+        return injector
 
 
 manager = DependencyManager()
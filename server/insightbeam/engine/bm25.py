@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import logging
+import os
+from datetime import datetime
+from typing import Any, List, Set, Tuple, Union
+
+import numpy as np
+from whoosh.fields import (  # type: ignore[import]
+    DATETIME,
+    ID,
+    TEXT,
+    Schema,
+    datetime_to_long,
+)
+from whoosh.index import Index, create_in, exists_in, open_dir  # type: ignore[import]
+from whoosh.qparser import OrGroup, QueryParser  # type: ignore[import]
+from whoosh.query import Or, Term  # type: ignore[import]
+from whoosh.searching import Searcher  # type: ignore[import]
+from whoosh.writing import IndexWriter  # type: ignore[import]
+
+from insightbeam.config import Configuration
+from insightbeam.engine.search import Input, SearchEngine, SearchResult
+
+_logger = logging.getLogger(__name__)
+
+
+class WhooshSearchEngine(SearchEngine):
+    _schema = Schema(
+        content=TEXT,
+        title=TEXT(stored=True),
+        uuid=ID(stored=True, analyzer=None),
+        url=TEXT(stored=True, analyzer=None),
+        published=DATETIME(stored=True, sortable=True),
+    )
+    _item_query_terms = 20
+    # Hits fetched per result wanted when they are re-ranked by recency
+    _recency_candidates = 4
+    _published_missing = np.iinfo(np.uint64).max
+    _published: Union[Tuple[int, np.ndarray], None] = None
+    _ix: Index
+    _parser: QueryParser
+
+    def __init__(self, cfg: Configuration, clean=True, read_only=False):
+        path = cfg.sengine_dir
+        if not os.path.exists(path):
+            os.mkdir(path)
+
+        if read_only:
+            # Every searcher opens the latest committed generation, nothing else to keep up to date
+            self._ix = open_dir(path)
+        elif clean or not exists_in(path):
+            self._ix = create_in(path, self._schema)
+        elif exists_in(path) and not clean:
+            self._ix = open_dir(path)
+            self._upgrade_schema()
+
+        self._configure_recency(cfg)
+        self._parser = QueryParser("content", self._schema, group=OrGroup.factory(0.8))
+        if not read_only:
+            self._start_writer(cfg)
+
+    def _upgrade_schema(self):
+        """
+        Add the fields introduced after a kept index was created
+        """
+        missing = [name for name in self._schema.names() if name not in self._ix.schema]
+        if len(missing) == 0:
+            return
+        writer: IndexWriter = self._ix.writer()
+        for name in missing:
+            _logger.info("Adding search index field [%s]", name)
+            writer.add_field(name, self._schema[name])
+        writer.commit()
+
+    def indexed_uuids(self) -> Set[str]:
+        with self._ix.searcher() as s:
+            return set(uuid.decode("utf-8") for uuid in s.lexicon("uuid"))
+
+    def _commit(self, inputs: List[Input]):
+        # Documents may be handed over more than once (e.g. re-priming an existing index), keep the first copy
+        with self._ix.searcher() as s:
+            indexed = set(
+                inp.uuid
+                for inp in inputs
+                if s.document_number(uuid=inp.uuid) is not None
+            )
+
+        writer: IndexWriter = self._ix.writer()
+        try:
+            for inp in inputs:
+                if inp.uuid in indexed:
+                    continue
+                indexed.add(inp.uuid)
+                writer.add_document(**inp.model_dump(exclude_none=True))
+        except Exception:
+            writer.cancel()
+            raise
+        # Leave segment merging to the off-peak optimize so hot commits stay cheap
+        writer.commit(merge=False)
+
+    def _optimize(self):
+        self._ix.optimize()
+
+    def search(self, query_expr: str, limit: int = 10) -> List[SearchResult]:
+        return self._search(self._parser.parse(query_expr), limit)
+
+    def search_item(self, item: Input, limit: int = 10) -> List[SearchResult]:
+        with self._ix.searcher() as s:
+            key_terms = s.key_terms_from_text(
+                "content",
+                f"{item.title} {item.content}",
+                numterms=self._item_query_terms,
+            )
+        query = Or([Term("content", term) for (term, _) in key_terms])
+
+        anchor = self._recency_anchor(item)
+        window = None
+        if self._window is not None:
+            window = (anchor - self._window, anchor + self._window)
+        candidates = limit + 1
+        if self._half_life is not None:
+            candidates *= self._recency_candidates
+
+        results = self._search(query, candidates, window)
+        for r in results:
+            r.score *= self._recency_decay(r.published, anchor)
+        results.sort(key=lambda r: r.score, reverse=True)
+        return [r for r in results if r.article_uuid != item.uuid][:limit]
+
+    def _published_column(self, s: Searcher) -> np.ndarray:
+        """
+        The sortable `published` column of every document (`_published_missing` where there is none), read once
+        per index generation
+        """
+        reader = s.reader()
+        cached = self._published
+        if cached is not None and cached[0] == reader.generation():
+            return cached[1]
+
+        column = np.full(
+            reader.doc_count_all(), self._published_missing, dtype=np.uint64
+        )
+        for leaf, offset in reader.leaf_readers():
+            # Segments written before the field was added have no column at all
+            if leaf.has_column("published"):
+                count = leaf.doc_count_all()
+                column[offset : offset + count] = np.fromiter(  # noqa: E203
+                    leaf.column_reader("published", translate=False),
+                    dtype=np.uint64,
+                    count=count,
+                )
+        self._published = (reader.generation(), column)
+        return column
+
+    def _search(
+        self,
+        query: Any,
+        limit: int,
+        window: Union[Tuple[datetime, datetime], None] = None,
+    ) -> List[SearchResult]:
+        with self._ix.searcher() as s:
+            allowed = None
+            if window is not None:
+                # A docnum filter from the column is far cheaper than a DateRange query filter or intersection
+                column = self._published_column(s)
+                (start, end) = (
+                    datetime_to_long(window[0]),
+                    datetime_to_long(window[1]),
+                )
+                # Documents without a date (indexed before dates were kept) are never filtered out
+                undated = column == self._published_missing
+                in_window = (column >= start) & (column <= end)
+                allowed = set(np.flatnonzero(in_window | undated).tolist())
+                # Whoosh takes an empty filter for no filter at all
+                if not allowed:
+                    return list()
+
+            results = s.search(query, limit=limit, filter=allowed, terms=True)
+            return [
+                SearchResult(
+                    article_uuid=hit["uuid"],
+                    article_title=hit["title"],
+                    matched_terms=[t for (_, t) in hit.matched_terms()],
+                    score=hit.score,
+                    published=hit.get("published"),
+                )
+                for hit in results
+            ]
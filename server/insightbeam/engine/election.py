@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import fcntl
+from contextlib import contextmanager
+from typing import Iterator, TextIO, Union
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Exclusive lock on `path` across processes, blocks until it is acquired
+    """
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class LeaderLock:
+    """
+    Elects a single leader among the processes sharing `path`, the one holding an exclusive lock on it. The
+    operating system releases the lock when the leader's process dies so another process can take over.
+    """
+
+    _path: str
+    _file: Union[TextIO, None]
+
+    def __init__(self, path: str):
+        self._path = path
+        self._file = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._file is not None
+
+    def try_acquire(self) -> bool:
+        if self._file is not None:
+            return True
+
+        f = open(self._path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterator, Tuple, Union
+
+from insightbeam.config import Configuration
+
+_logger = logging.getLogger(__name__)
+
+
+class HtmlCache:
+    """
+    On disk cache of raw article html.
+
+    Bodies are stored content addressed (`objects/<sha256>`) so the same page behind several urls is kept once,
+    an sqlite index maps each url to its body along with when it stops being fresh. Once the bodies exceed
+    `max_bytes` the least recently used ones are evicted.
+    """
+
+    _max_age_re = re.compile(r"\bmax-age\s*=\s*(\d+)")
+    _path: str
+    _ttl: int
+    _max_bytes: int
+    _lock: threading.Lock
+    _conn: sqlite3.Connection
+
+    def __init__(self, cfg: Configuration):
+        self._path = cfg.html_cache_dir
+        self._ttl = cfg.html_cache_ttl
+        self._max_bytes = cfg.html_cache_max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(self._path, "objects"), exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(self._path, "index.db"), check_same_thread=False
+        )
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS object ("
+                "hash TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS url ("
+                "url TEXT PRIMARY KEY, hash TEXT NOT NULL, fetched_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS object_last_access ON object (last_access)"
+            )
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self._path, "objects", digest[:2], digest)
+
+    def _freshness(self, cache_control: Union[str, None]) -> Union[int, None]:
+        """
+        Seconds a response may be served from the cache, None when it must not be stored at all
+        """
+        directives = (cache_control or "").lower()
+        if "no-store" in directives:
+            return None
+        elif "no-cache" in directives:
+            return 0
+
+        max_age = self._max_age_re.search(directives)
+        return int(max_age.group(1)) if max_age is not None else self._ttl
+
+    def get(self, url: str, allow_stale: bool = False) -> Union[str, None]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT hash, expires_at FROM url WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            (digest, expires_at) = row
+            if expires_at <= now and not allow_stale:
+                return None
+
+            try:
+                with open(self._object_path(digest), "rb") as f:
+                    html = f.read().decode("utf-8")
+            except FileNotFoundError:
+                self._conn.execute("DELETE FROM url WHERE url = ?", (url,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute(
+                "UPDATE object SET last_access = ? WHERE hash = ?", (now, digest)
+            )
+            self._conn.commit()
+            return html
+
+    def put(self, url: str, html: str, cache_control: Union[str, None] = None):
+        freshness = self._freshness(cache_control)
+        if freshness is None:
+            return
+
+        body = html.encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()
+        object_path = self._object_path(digest)
+        now = time.time()
+
+        with self._lock:
+            if not os.path.exists(object_path):
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                tmp_path = f"{object_path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(body)
+                os.replace(tmp_path, object_path)
+
+            self._conn.execute(
+                "INSERT INTO object (hash, size, last_access) VALUES (?, ?, ?) "
+                "ON CONFLICT (hash) DO UPDATE SET last_access = excluded.last_access",
+                (digest, len(body), now),
+            )
+            self._conn.execute(
+                "INSERT INTO url (url, hash, fetched_at, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET hash = excluded.hash, fetched_at = excluded.fetched_at, "
+                "expires_at = excluded.expires_at",
+                (url, digest, now, now + freshness),
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM object"
+        ).fetchone()
+        if total <= self._max_bytes:
+            return
+
+        evicted = 0
+        for digest, size in self._conn.execute(
+            "SELECT hash, size FROM object ORDER BY last_access"
+        ).fetchall():
+            if total <= self._max_bytes:
+                break
+            self._conn.execute("DELETE FROM url WHERE hash = ?", (digest,))
+            self._conn.execute("DELETE FROM object WHERE hash = ?", (digest,))
+            try:
+                os.remove(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        self._conn.commit()
+        _logger.info("Evicted %s html cache entries", evicted)
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        """
+        Every cached (url, html) pair regardless of freshness
+        """
+        with self._lock:
+            urls = [
+                url for (url,) in self._conn.execute("SELECT url FROM url").fetchall()
+            ]
+        for url in urls:
+            html = self.get(url, allow_stale=True)
+            if html is not None:
+                yield (url, html)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import datetime
+import logging
+from typing import Callable, List, TypeVar, Union
+
+from insightbeam.common.batching import BatchWriter
+
+_logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+
+class BufferedIndexWriter(BatchWriter[T]):
+    """
+    Single background thread owning all index writes, documents are committed in batches (see `BatchWriter`).
+    While idle during `optimize_hour` the index is optimized once a day.
+    """
+
+    _optimize: Union[Callable[[], None], None]
+    _optimize_hour: Union[int, None]
+    _last_optimized: Union[datetime.date, None]
+
+    def __init__(
+        self,
+        commit: Callable[[List[T]], None],
+        optimize: Union[Callable[[], None], None] = None,
+        batch_size: int = 500,
+        flush_interval: float = 2.0,
+        queue_size: int = 10_000,
+        optimize_hour: Union[int, None] = None,
+        name: str = "index-writer",
+    ):
+        self._optimize = optimize
+        self._optimize_hour = optimize_hour
+        self._last_optimized = None
+        super().__init__(
+            commit,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+            queue_size=queue_size,
+            name=name,
+        )
+
+    def _idle(self):
+        if self._optimize is None or self._optimize_hour is None:
+            return
+
+        now = datetime.datetime.now()
+        if now.hour == self._optimize_hour and self._last_optimized != now.date():
+            try:
+                self._optimize()
+                self._last_optimized = now.date()
+            except Exception as e:
+                _logger.error("Exception optimizing the index %s", e)
@@ -2,25 +2,50 @@ from __future__ import annotations
 
 import logging
 import re
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, List, Union
-
-import bs4
-from bs4 import ResultSet, Tag
-from langchain.chat_models import ChatOpenAI
-from langchain.chat_models.base import BaseChatModel
-from langchain.schema import HumanMessage, SystemMessage
-from langchain.schema.messages import BaseMessageChunk
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Tuple, Union, cast
+
 from pydantic import BaseModel
 
-from insightbeam.common import Article
+from insightbeam.common import Article, LlmCall
 from insightbeam.config import Configuration
+from insightbeam.engine.resilience import (
+    CallStats,
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilienceState,
+    ResilientCaller,
+)
+from insightbeam.engine.routing import ModelRouter, ModelTier, TokenCounter
+
+if TYPE_CHECKING:
+    import bs4
+    from bs4 import ResultSet, Tag
+    from langchain.chat_models.base import BaseChatModel
+    from langchain.schema.messages import BaseMessage, BaseMessageChunk
+    from langchain.schema.output import ChatGeneration
 
 _logger = logging.getLogger(__name__)
 
 
 class Interpreter:
-    _chat_model: BaseChatModel
+    """
+    Generates the article analyses with the chat model. Analysis and counter analysis prompts are each routed
+    to a model tier by their token count. Every call is handed to `record` (when given) with the model it was
+    routed to, its token usage, latency, retries and outcome.
+    """
+
+    _cfg: Configuration
+    _chat_models: Dict[Tuple[str, Union[str, None]], BaseChatModel]
+    _chat_models_lock: threading.Lock
+    _token_counter: TokenCounter
+    _analysis_router: ModelRouter
+    _counter_router: ModelRouter
+    _caller: ResilientCaller
+    _record: Union[Callable[[LlmCall], None], None]
     _fail_token = "IGNORE"
 
     _gen_analysis_sys_msg = """You analyze articles and help the user determine the main subject matter the article
@@ -48,6 +73,36 @@ class Interpreter:
     Report:
     """
 
+    _gen_packed_analysis_sys_msg = """You analyze articles and help the user determine the main subject matter each
+    article is talking about along with the view points made and supporting arguments for that view point. You will
+    be given several articles, each one inside an `<article id="[id]">` tag. Provide one report per article, tagged
+    with the id of the article it is about, in the following format:
+
+     <analysis id="[id of the article]">
+        <subject>[subject goes here]</subject>
+        <view-points>
+            <view-point>
+                <point>[The point being made]</point>
+                <arguments>
+                    <argument>[supporting argument that supports the point]</argument>
+                </arguments>
+            </view-point>
+        </view-points>
+     </analysis>
+
+     The subject, points and arguments included in a report should be easily searchable in the article the report
+     is about, never mix the content of different articles in one report.
+     """
+
+    _gen_packed_analysis_template = """
+    Articles:
+    {articles}
+
+    Reports:
+    """
+
+    _packed_article_template = '<article id="{id}">\n{content}\n</article>'
+
     _gen_counter_sys_msg = """Given a subject, points made about the subject and related articles, identify
     which, if any that provide countering/opposite points. Your response should be in the following format:
     <analysis>
@@ -90,31 +145,214 @@ class Interpreter:
     _sub_analysis_err_msg_header = "There was an error retrieving the sub analysis"
     _sub_analysis_err_msg_fmt = "{header}, error: [{error}]"
 
-    def __init__(self, cfg: Configuration):
-        self._chat_model = ChatOpenAI(
-            temperature=0.2,
-            openai_api_key=cfg.openai_api_key,
-            request_timeout=cfg.dep_call_timeout,
-            model="gpt-3.5-turbo-16k",
+    def __init__(
+        self,
+        cfg: Configuration,
+        record: Union[Callable[[LlmCall], None], None] = None,
+    ):
+        # langchain makes up most of the server's import time, it is only loaded once an interpreter is built
+        import openai
+
+        self._cfg = cfg
+        self._chat_models = dict()
+        self._chat_models_lock = threading.Lock()
+        self._token_counter = TokenCounter()
+        self._analysis_router = ModelRouter(
+            cfg.analysis_model_tiers, cfg.long_context_model, self._token_counter
+        )
+        self._counter_router = ModelRouter(
+            cfg.counter_model_tiers, cfg.long_context_model, self._token_counter
+        )
+        self._caller = ResilientCaller(
+            retries=cfg.dep_call_retry,
+            breaker=CircuitBreaker(
+                cfg.dep_call_breaker_threshold, cfg.dep_call_breaker_reset
+            ),
+            hedge=cfg.dep_call_hedge,
+            non_retryable=(
+                openai.error.InvalidRequestError,
+                openai.error.AuthenticationError,
+                openai.error.PermissionError,
+            ),
         )
 
-    def _sub_analysis(self, item: Article) -> BaseMessageChunk:
-        _logger.info("Generating analysis for (title) (%s)", item.title)
-        return self._chat_model.invoke(
-            [
-                SystemMessage(content=self._gen_analysis_sys_msg),
-                HumanMessage(
-                    content=self._gen_analysis_template.format(article=item.content)
-                ),
-            ]
+        self._record = record
+
+    def _chat_model(self, tier: ModelTier) -> BaseChatModel:
+        key = (tier.model, tier.base_url)
+        with self._chat_models_lock:
+            if key not in self._chat_models:
+                from langchain.chat_models import ChatOpenAI
+
+                self._chat_models[key] = ChatOpenAI(
+                    temperature=0.2,
+                    openai_api_key=self._cfg.openai_api_key,
+                    request_timeout=self._cfg.dep_call_timeout,
+                    model=tier.model,
+                    # Retries are handled by the resilient caller
+                    max_retries=0,
+                    openai_api_base=tier.base_url,
+                )
+            return self._chat_models[key]
+
+    def _route(
+        self, operation: str, router: ModelRouter, messages: List[BaseMessage]
+    ) -> Tuple[ModelTier, int]:
+        (tier, tokens) = router.route(messages)
+        _logger.info(
+            "Routing %s prompt of %s tokens to [%s]", operation, tokens, tier.model
         )
+        return (tier, tokens)
 
-    def counter_analysis(
+    def _invoke(
         self,
-        url: str,
-        article_analysis: Analysis,
-        relevant: List[Article],
-    ) -> ArticleAnalysis:
+        operation: str,
+        router: ModelRouter,
+        messages: List[BaseMessage],
+        origin: Union[CallOrigin, None] = None,
+    ) -> BaseMessage:
+        (tier, routed_tokens) = self._route(operation, router, messages)
+        chat_model = self._chat_model(tier)
+        stats = CallStats()
+        start = time.monotonic()
+        outcome = "error"
+        usage: Dict[str, int] = dict()
+        try:
+            result = self._caller.call(lambda: chat_model.generate([messages]), stats)
+            usage = (result.llm_output or dict()).get("token_usage", dict())
+            outcome = "ok"
+            return cast("ChatGeneration", result.generations[0][0]).message
+        except CircuitOpenError:
+            outcome = "rejected"
+            raise
+        finally:
+            self._record_call(
+                operation,
+                tier,
+                routed_tokens,
+                start,
+                stats,
+                outcome,
+                origin,
+                usage.get("prompt_tokens"),
+                usage.get("completion_tokens"),
+            )
+
+    def _record_call(
+        self,
+        operation: str,
+        tier: ModelTier,
+        routed_tokens: int,
+        start: float,
+        stats: CallStats,
+        outcome: str,
+        origin: Union[CallOrigin, None],
+        prompt_tokens: Union[int, None] = None,
+        completion_tokens: Union[int, None] = None,
+    ):
+        if self._record is None:
+            return
+        origin = origin or CallOrigin()
+        try:
+            self._record(
+                LlmCall(
+                    operation=operation,
+                    model=tier.model,
+                    routed_tokens=routed_tokens,
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                    latency_ms=(time.monotonic() - start) * 1000,
+                    retries=stats.retries,
+                    outcome=outcome,
+                    source_item_uuid=origin.source_item_uuid,
+                    source_uuid=origin.source_uuid,
+                    created_at=datetime.now(timezone.utc).replace(tzinfo=None),
+                )
+            )
+        except Exception as e:
+            _logger.warning("Could not record the chat model call %s", e)
+
+    def resilience_state(self) -> ResilienceState:
+        return self._caller.state()
+
+    def _messages(self, system: str, human: str) -> List[BaseMessage]:
+        from langchain.schema import HumanMessage, SystemMessage
+
+        return [SystemMessage(content=system), HumanMessage(content=human)]
+
+    def _analysis_messages(self, item: Article) -> List[BaseMessage]:
+        return self._messages(
+            self._gen_analysis_sys_msg,
+            self._gen_analysis_template.format(article=item.content),
+        )
+
+    def _sub_analysis(
+        self, item: Article, origin: Union[CallOrigin, None] = None
+    ) -> BaseMessage:
+        _logger.info("Generating analysis for (title) (%s)", item.title)
+        return self._invoke(
+            "analysis", self._analysis_router, self._analysis_messages(item), origin
+        )
+
+    def _open_stream(
+        self, chat_model: BaseChatModel, messages: List[BaseMessage]
+    ) -> Tuple[str, Iterator[BaseMessageChunk]]:
+        """
+        Start a streamed completion and wait for its first chunk, so connection failures are retried like any
+        other call, failures mid-stream are not retried.
+        """
+        chunks = chat_model.stream(messages)
+        first = next(chunks, None)
+        return (first.content if first is not None else "", chunks)
+
+    def stream_analysis(
+        self, item: Article, origin: Union[CallOrigin, None] = None
+    ) -> Iterator[AnalysisStreamEvent]:
+        """
+        Analyze a single article emitting the subject and each view point as soon as the model has closed them,
+        the last event is either the complete `analysis` or an `error`. Streamed completions carry no token
+        usage, the call is recorded without it.
+        """
+        _logger.info("Streaming analysis for (title) (%s)", item.title)
+        parser = AnalysisStreamParser()
+        messages = self._analysis_messages(item)
+        (tier, routed_tokens) = self._route(
+            "analysis_stream", self._analysis_router, messages
+        )
+        chat_model = self._chat_model(tier)
+        stats = CallStats()
+        start = time.monotonic()
+        outcome = "error"
+        try:
+            (first, chunks) = self._caller.call(
+                lambda: self._open_stream(chat_model, messages), stats
+            )
+            yield from parser.feed(first)
+            for chunk in chunks:
+                yield from parser.feed(chunk.content)
+            outcome = "ok"
+            analysis = ArticleAnalysis(
+                article_url=item.url, analysis=Analysis.parse_xml(parser.content)
+            )
+            yield AnalysisStreamEvent(event="analysis", analysis=analysis)
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            if isinstance(e, CircuitOpenError):
+                outcome = "rejected"
+            msg = self._sub_analysis_err_msg_fmt.format(
+                header=self._sub_analysis_err_msg_header, error=e
+            )
+            yield AnalysisStreamEvent(event="error", error=msg)
+        finally:
+            self._record_call(
+                "analysis_stream", tier, routed_tokens, start, stats, outcome, origin
+            )
+
+    def _counter_messages(
+        self, article_analysis: Analysis, relevant: List[Article]
+    ) -> List[BaseMessage]:
         points = "\n".join(
             [
                 self._point_template.format(point=vp.point)
@@ -130,19 +368,25 @@ class Interpreter:
         msg = self._gen_counter_template.format(
             subject=article_analysis.subject, points=points, related=related
         )
-        try:
-            opposing_view = self._chat_model.invoke(
-                [
-                    SystemMessage(content=self._gen_counter_sys_msg),
-                    HumanMessage(content=msg),
-                ]
-            )
+        return self._messages(self._gen_counter_sys_msg, msg)
 
-            if opposing_view.content != self._fail_token:
-                analysis = CounterAnalysis.parse_xml(opposing_view.content)
-                error = None
+    def counter_analysis(
+        self,
+        url: str,
+        article_analysis: Analysis,
+        relevant: List[Article],
+        origin: Union[CallOrigin, None] = None,
+    ) -> ArticleAnalysis:
+        """
+        In `map_reduce` mode every related article is compared against the view points in its own prompt,
+        concurrently, and the counters found are merged. Otherwise all of them go in a single prompt.
+        """
+        try:
+            if self._cfg.counter_mode == "map_reduce":
+                analysis = self._map_reduce_counters(article_analysis, relevant, origin)
             else:
-                raise ValueError("Interpreter returned fail token")
+                analysis = self._single_counters(article_analysis, relevant, origin)
+            error = None
         except Exception as e:
             analysis = None
             error = str(e)
@@ -154,43 +398,241 @@ class Interpreter:
             error=error,
         )
 
-    def analyze(self, items: List[Article]) -> List[ArticleAnalysis]:
-        sub_analyses: Dict[str, str] = dict()
-        with ThreadPoolExecutor(max_workers=len(items)) as tpe:
+    def _single_counters(
+        self,
+        article_analysis: Analysis,
+        relevant: List[Article],
+        origin: Union[CallOrigin, None],
+    ) -> CounterAnalysis:
+        opposing_view = self._invoke(
+            "counter_analysis",
+            self._counter_router,
+            self._counter_messages(article_analysis, relevant),
+            origin,
+        )
+
+        if opposing_view.content == self._fail_token:
+            raise ValueError("Interpreter returned fail token")
+        return CounterAnalysis.parse_xml(opposing_view.content)
+
+    def _related_counters(
+        self,
+        article_analysis: Analysis,
+        related: Article,
+        origin: Union[CallOrigin, None],
+    ) -> CounterAnalysis:
+        opposing_view = self._invoke(
+            "counter_analysis_map",
+            self._counter_router,
+            self._counter_messages(article_analysis, [related]),
+            origin,
+        )
+
+        if opposing_view.content.strip() == self._fail_token:
+            return CounterAnalysis(counters=[])
+        counters = CounterAnalysis.parse_xml(opposing_view.content).counters
+        # The prompt only holds this article, the url the model echoes back is not needed
+        return CounterAnalysis(
+            counters=[
+                counter.model_copy(update={"article_url": related.url})
+                for counter in counters
+            ]
+        )
+
+    def _map_reduce_counters(
+        self,
+        article_analysis: Analysis,
+        relevant: List[Article],
+        origin: Union[CallOrigin, None],
+    ) -> CounterAnalysis:
+        """
+        :raise RuntimeError: When the call failed for any related article, partial counters are never kept
+        """
+        related = [article for article in relevant if article.content.strip()]
+        if not related:
+            return CounterAnalysis(counters=[])
+
+        results: List[Union[CounterAnalysis, None]] = [None] * len(related)
+        errors = list()
+        workers = min(len(related), self._cfg.counter_workers)
+        with ThreadPoolExecutor(max_workers=workers) as tpe:
+            counter_tasks = {
+                tpe.submit(self._related_counters, article_analysis, article, origin): i
+                for (i, article) in enumerate(related)
+            }
+
+            for counter_task in as_completed(counter_tasks):
+                i = counter_tasks[counter_task]
+                try:
+                    results[i] = counter_task.result()
+                except Exception as e:
+                    _logger.warning(
+                        "Error generating the counters from (%s) %s", related[i].url, e
+                    )
+                    errors.append(str(e))
+
+        if errors:
+            raise RuntimeError(
+                "Counter analysis failed for {} of {} related articles, error: [{}]".format(
+                    len(errors), len(related), errors[0]
+                )
+            )
+        # Merged in the order of relevance, not completion
+        return CounterAnalysis.merge([r for r in results if r is not None])
+
+    def _packed_analysis_messages(self, items: List[Article]) -> List[BaseMessage]:
+        articles = "\n\n".join(
+            self._packed_article_template.format(id=i, content=item.content)
+            for (i, item) in enumerate(items)
+        )
+        return self._messages(
+            self._gen_packed_analysis_sys_msg,
+            self._gen_packed_analysis_template.format(articles=articles),
+        )
+
+    def _packed_analysis(
+        self, items: List[Article], origin: Union[CallOrigin, None] = None
+    ) -> Dict[int, Analysis]:
+        """
+        The analyses found in the response by the position of their article in `items`
+        """
+        _logger.info("Generating packed analysis for %s articles", len(items))
+        response = self._invoke(
+            "analysis_packed",
+            self._analysis_router,
+            self._packed_analysis_messages(items),
+            origin,
+        )
+        analyses = Analysis.parse_packed_xml(response.content)
+        return {i: analyses[str(i)] for i in range(len(items)) if str(i) in analyses}
+
+    def _pack(self, items: List[Article]) -> Tuple[List[List[int]], List[int]]:
+        """
+        Group the positions of consecutive articles while their content fits the packing budget, articles
+        left on their own (too long or the last of their group) are analyzed one per call
+        """
+        packs: List[List[int]] = list()
+        singles: List[int] = list()
+        if len(items) < 2 or self._cfg.analysis_pack_tokens <= 0:
+            return (packs, list(range(len(items))))
+
+        def close(pack: List[int]):
+            if len(pack) > 1:
+                packs.append(pack)
+            else:
+                singles.extend(pack)
+
+        pack: List[int] = list()
+        pack_tokens = 0
+        for i, item in enumerate(items):
+            tokens = self._token_counter.count(item.content)
+            if tokens > self._cfg.analysis_pack_tokens:
+                singles.append(i)
+                continue
+            if (
+                pack_tokens + tokens > self._cfg.analysis_pack_tokens
+                or len(pack) >= self._cfg.analysis_pack_max_items
+            ):
+                close(pack)
+                pack = list()
+                pack_tokens = 0
+            pack.append(i)
+            pack_tokens += tokens
+        close(pack)
+        return (packs, singles)
+
+    def analyze(
+        self, items: List[Article], origins: Union[List[CallOrigin], None] = None
+    ) -> List[ArticleAnalysis]:
+        """
+        Short articles are analyzed several per call (up to `analysis_pack_tokens` of content), an article
+        missing from a packed response is analyzed on its own.
+
+        :param origins: What each item's call is made for, in the order of `items`
+        :return: The analyses in the order of `items`
+        """
+        item_origins: List[Union[CallOrigin, None]] = [None] * len(items)
+        if origins is not None:
+            item_origins = list(origins)
+        results: List[Union[ArticleAnalysis, None]] = [None] * len(items)
+        (packs, singles) = self._pack(items)
+
+        workers = max(1, min(len(packs) + len(singles), self._cfg.analysis_workers))
+        with ThreadPoolExecutor(max_workers=workers) as tpe:
             analysis_tasks = {
-                tpe.submit(self._sub_analysis, item): item.url for item in items
+                tpe.submit(self._sub_analysis, items[i], item_origins[i]): i
+                for i in singles
+            }
+            pack_tasks = {
+                tpe.submit(
+                    self._packed_analysis,
+                    [items[i] for i in pack],
+                    self._pack_origin([item_origins[i] for i in pack]),
+                ): pack
+                for pack in packs
             }
 
+            for pack_task in as_completed(pack_tasks):
+                pack = pack_tasks[pack_task]
+                try:
+                    found = pack_task.result()
+                except Exception as e:
+                    _logger.warning("Error generating packed analysis %s", e)
+                    found = dict()
+                for position, i in enumerate(pack):
+                    if position in found:
+                        results[i] = ArticleAnalysis(
+                            article_url=items[i].url, analysis=found[position]
+                        )
+                    else:
+                        fallback = tpe.submit(
+                            self._sub_analysis, items[i], item_origins[i]
+                        )
+                        analysis_tasks[fallback] = i
+
             for analysis_task in as_completed(analysis_tasks):
-                url = analysis_tasks[analysis_task]
+                i = analysis_tasks[analysis_task]
                 try:
-                    response: BaseMessageChunk = analysis_task.result()
-                    sub_analyses[url] = response.content
+                    response: BaseMessage = analysis_task.result()
+                    sub_analysis = response.content
                 except Exception as e:
-                    msg = self._sub_analysis_err_msg_fmt.format(
+                    sub_analysis = self._sub_analysis_err_msg_fmt.format(
                         header=self._sub_analysis_err_msg_header, error=e
                     )
-                    sub_analyses[url] = msg
-            return self._process_raw_analysis(sub_analyses)
+                results[i] = self._process_raw_analysis(items[i].url, sub_analysis)
+        return [cast(ArticleAnalysis, result) for result in results]
 
-    def _process_raw_analysis(self, analyses: Dict[str, str]) -> List[ArticleAnalysis]:
-        processed_analyses = list()
-        for url, analysis in analyses.items():
-            try:
-                if re.match(self._sub_analysis_err_msg_header, analysis):
-                    raise ValueError(analysis)
+    @classmethod
+    def _pack_origin(
+        cls, origins: List[Union[CallOrigin, None]]
+    ) -> Union[CallOrigin, None]:
+        """
+        A packed call is attributed to the source its articles share, to no item in particular
+        """
+        sources = set(origin.source_uuid for origin in origins if origin is not None)
+        if len(sources) == 1 and None not in origins:
+            return CallOrigin(source_uuid=sources.pop())
+        return None
 
-                parsed_analysis = Analysis.parse_xml(analysis)
-                error = None
-            except Exception as e:
-                parsed_analysis = None
-                error = str(e)
+    def _process_raw_analysis(self, url: str, analysis: str) -> ArticleAnalysis:
+        try:
+            if re.match(self._sub_analysis_err_msg_header, analysis):
+                raise ValueError(analysis)
 
-            processed_analyses.append(
-                ArticleAnalysis(article_url=url, analysis=parsed_analysis, error=error)
-            )
+            parsed_analysis = Analysis.parse_xml(analysis)
+            error = None
+        except Exception as e:
+            parsed_analysis = None
+            error = str(e)
+
+        return ArticleAnalysis(article_url=url, analysis=parsed_analysis, error=error)
+
+
+def _soup(content: str) -> bs4.BeautifulSoup:
+    # bs4 is only imported once a model response is parsed, not when the api starts
+    import bs4
 
-        return processed_analyses
+    return bs4.BeautifulSoup(content, features="lxml")
 
 
 class XmlParseNode:
@@ -199,6 +641,8 @@ class XmlParseNode:
         """
         :raise ValueError: When the tag name cannot be found in the soup/tag provided
         """
+        from bs4 import Tag
+
         result = soup.find(tagname)
         if result is not None and isinstance(result, Tag):
             return result
@@ -222,15 +666,74 @@ class ViewPoint(BaseModel, XmlParseNode):
         return cls(point=point, arguments=arguments)
 
 
+class AnalysisStreamParser:
+    """
+    Incrementally scans a streamed `<analysis>` report, a node is only parsed once its closing tag arrived
+    """
+
+    _view_point_re = re.compile(r"<view-point>.*?</view-point>", re.DOTALL)
+    _subject_re = re.compile(r"<subject>(.*?)</subject>", re.DOTALL)
+    content: str
+    _subject_sent: bool
+    _scan_from: int
+
+    def __init__(self):
+        self.content = ""
+        self._subject_sent = False
+        self._scan_from = 0
+
+    def feed(self, chunk: str) -> Iterator[AnalysisStreamEvent]:
+        self.content += chunk
+
+        if not self._subject_sent:
+            subject = self._subject_re.search(self.content)
+            if subject is not None:
+                self._subject_sent = True
+                subject_soup = _soup(subject.group(0))
+                yield AnalysisStreamEvent(
+                    event="subject",
+                    subject=XmlParseNode._get_tag("subject", subject_soup).get_text(),
+                )
+
+        for match in self._view_point_re.finditer(self.content, self._scan_from):
+            self._scan_from = match.end()
+            view_point_soup = _soup(match.group(0))
+            yield AnalysisStreamEvent(
+                event="view_point",
+                view_point=ViewPoint.parse_xml(
+                    XmlParseNode._get_tag("view-point", view_point_soup)
+                ),
+            )
+
+
 class Analysis(BaseModel, XmlParseNode):
     subject: str
     view_points: List[ViewPoint]
 
     @classmethod
     def parse_xml(cls, content: str) -> Analysis:
-        content_soup = bs4.BeautifulSoup(content, features="lxml")
-        analysis_node = cls._get_tag("analysis", content_soup)
+        content_soup = _soup(content)
+        return cls._parse_node(cls._get_tag("analysis", content_soup))
 
+    @classmethod
+    def parse_packed_xml(cls, content: str) -> Dict[str, Analysis]:
+        """
+        The `<analysis id="...">` reports of a packed response by id, reports that do not parse are left out
+        """
+        content_soup = _soup(content)
+        analyses = dict()
+        for analysis_node in content_soup.find_all("analysis"):
+            analysis_id = analysis_node.get("id")
+            if not isinstance(analysis_id, str) or analysis_id.strip() in analyses:
+                continue
+            try:
+                analyses[analysis_id.strip()] = cls._parse_node(analysis_node)
+            except ValueError as e:
+                _logger.warning("Skipping packed analysis [%s] %s", analysis_id, e)
+        return analyses
+
+    @classmethod
+    def _parse_node(cls, analysis_node: Tag) -> Analysis:
         subject_node = cls._get_tag("subject", analysis_node)
         viewpoints_node = cls._get_tag("view-points", analysis_node)
 
@@ -265,16 +768,56 @@ class CounterAnalysis(BaseModel, XmlParseNode):
 
     @classmethod
     def parse_xml(cls, content: str) -> CounterAnalysis:
-        content_soup = bs4.BeautifulSoup(content, features="lxml")
+        content_soup = _soup(content)
         analysis_node = cls._get_tag("analysis", content_soup)
         counters_node = cls._get_tag("counters", analysis_node)
         counter_nodes = counters_node.find_all("counter")
         counters = [Counter.parse_xml(counter) for counter in counter_nodes]
         return cls(counters=counters)
 
+    @classmethod
+    def merge(cls, analyses: List[CounterAnalysis]) -> CounterAnalysis:
+        """
+        Concatenate the counters dropping repeats, counters are the same when their article and both view
+        points match ignoring case and whitespace
+        """
+        seen = set()
+        counters = list()
+        for analysis in analyses:
+            for counter in analysis.counters:
+                key = tuple(
+                    " ".join(value.split()).casefold()
+                    for value in (
+                        counter.article_url,
+                        counter.original_view_point,
+                        counter.counter_view_point,
+                    )
+                )
+                if key not in seen:
+                    seen.add(key)
+                    counters.append(counter)
+        return cls(counters=counters)
+
+
+class CallOrigin(BaseModel):
+    """
+    What a chat model call is made for, kept with the call in the usage ledger
+    """
+
+    source_item_uuid: Union[int, None] = None
+    source_uuid: Union[int, None] = None
+
 
 class ArticleAnalysis(BaseModel):
     article_url: str
     analysis: Union[Analysis, None] = None
     counter: Union[CounterAnalysis, None] = None
     error: Union[str, None] = None
+
+
+class AnalysisStreamEvent(BaseModel):
+    event: str
+    subject: Union[str, None] = None
+    view_point: Union[ViewPoint, None] = None
+    analysis: Union[ArticleAnalysis, None] = None
+    error: Union[str, None] = None
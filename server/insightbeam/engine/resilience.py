@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Tuple, Type, TypeVar, Union
+
+from pydantic import BaseModel
+
+_logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    ...
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast until `reset_timeout` seconds have
+    passed, then lets a single trial call through (half open) which either closes or re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    _failure_threshold: int
+    _reset_timeout: float
+    _state: str
+    _failures: int
+    _opened_at: float
+    _lock: threading.Lock
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            elif (
+                self._state == self.OPEN
+                and time.monotonic() - self._opened_at >= self._reset_timeout
+            ):
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                _logger.info("Circuit closed")
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= self._failure_threshold
+            ):
+                _logger.warning("Circuit opened after %s failures", self._failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class CallStats(BaseModel):
+    """
+    Filled in by `ResilientCaller.call` for the single call it is passed to
+    """
+
+    retries: int = 0
+
+
+class ResilienceState(BaseModel):
+    breaker: str
+    consecutive_failures: int
+    calls: int
+    retries: int
+    rejected: int
+    hedges: int
+    hedges_won: int
+    p95_latency_ms: Union[float, None]
+
+
+class ResilientCaller:
+    """
+    Runs calls to an upstream dependency with retries (exponential backoff with full jitter), a circuit breaker
+    and, optionally, hedging: when a call has not answered after the p95 of recent latencies a second identical
+    call is started and whichever answers first wins.
+    """
+
+    _retries: int
+    _backoff_base: float
+    _backoff_max: float
+    _non_retryable: Tuple[Type[BaseException], ...]
+    _breaker: CircuitBreaker
+    _hedge: bool
+    _hedge_min_samples = 20
+    _latencies: Deque[float]
+    _executor: Union[ThreadPoolExecutor, None]
+    _lock: threading.Lock
+    _calls: int
+    _retried: int
+    _rejected: int
+    _hedges: int
+    _hedges_won: int
+
+    def __init__(
+        self,
+        retries: int,
+        breaker: CircuitBreaker,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        hedge: bool = False,
+        hedge_workers: int = 16,
+        non_retryable: Tuple[Type[BaseException], ...] = (),
+    ):
+        self._retries = retries
+        self._breaker = breaker
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._hedge = hedge
+        self._non_retryable = non_retryable
+        self._latencies = deque(maxlen=200)
+        self._executor = (
+            ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="hedge")
+            if hedge
+            else None
+        )
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._retried = 0
+        self._rejected = 0
+        self._hedges = 0
+        self._hedges_won = 0
+
+    def _p95(self) -> Union[float, None]:
+        with self._lock:
+            if len(self._latencies) < self._hedge_min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(
+            0, min(self._backoff_max, self._backoff_base * 2**attempt)
+        )
+
+    def call(self, func: Callable[[], T], stats: Union[CallStats, None] = None) -> T:
+        """
+        :raise CircuitOpenError: When the upstream is considered unhealthy
+        :raise Exception: The last error raised by `func` once the retries are exhausted
+        """
+        with self._lock:
+            self._calls += 1
+
+        attempt = 0
+        while True:
+            if not self._breaker.allow():
+                with self._lock:
+                    self._rejected += 1
+                raise CircuitOpenError("Upstream unavailable, circuit is open")
+
+            start = time.monotonic()
+            try:
+                result = self._attempt(func)
+            except self._non_retryable:
+                # The upstream answered, the request itself is at fault
+                self._breaker.record_success()
+                raise
+            except Exception as e:
+                self._breaker.record_failure()
+                if attempt >= self._retries:
+                    raise
+                delay = self._backoff(attempt)
+                attempt += 1
+                with self._lock:
+                    self._retried += 1
+                if stats is not None:
+                    stats.retries = attempt
+                _logger.warning(
+                    "Upstream call failed (attempt %s/%s), retrying in %.2fs: %s",
+                    attempt,
+                    self._retries + 1,
+                    delay,
+                    e,
+                )
+                time.sleep(delay)
+                continue
+
+            self._breaker.record_success()
+            with self._lock:
+                self._latencies.append(time.monotonic() - start)
+            return result
+
+    def _attempt(self, func: Callable[[], T]) -> T:
+        hedge_delay = self._p95() if self._executor is not None else None
+        if self._executor is None or hedge_delay is None:
+            return func()
+
+        primary: Future = self._executor.submit(func)
+        (done, _pending) = wait([primary], timeout=hedge_delay)
+        if len(done) > 0:
+            return primary.result()
+
+        with self._lock:
+            self._hedges += 1
+        hedged: Future = self._executor.submit(func)
+        racing = {primary, hedged}
+        while len(racing) > 0:
+            (done, racing) = wait(racing, return_when=FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedged:
+                        with self._lock:
+                            self._hedges_won += 1
+                    return task.result()
+        # Both failed, surface the primary's error
+        return primary.result()
+
+    def state(self) -> ResilienceState:
+        p95 = self._p95()
+        with self._lock:
+            return ResilienceState(
+                breaker=self._breaker.state,
+                consecutive_failures=self._breaker.failures,
+                calls=self._calls,
+                retries=self._retried,
+                rejected=self._rejected,
+                hedges=self._hedges,
+                hedges_won=self._hedges_won,
+                p95_latency_ms=p95 * 1000 if p95 is not None else None,
+            )
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, List, Tuple, Union
+
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from langchain.schema.messages import BaseMessage
+
+_logger = logging.getLogger(__name__)
+
+
+class TokenCounter:
+    """
+    Counts tokens the way the chat completions API does (cl100k_base plus the per message overhead). The
+    encoding is fetched by tiktoken on first use, when it cannot be loaded (e.g. no network access and no
+    cached copy) the count is estimated from the number of characters instead.
+    """
+
+    _encoding_name = "cl100k_base"
+    _chars_per_token = 4
+    _tokens_per_message = 4
+    _tokens_per_reply = 3
+    _encoding: Any
+    _loaded: bool
+    _lock: threading.Lock
+
+    def __init__(self):
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _get_encoding(self) -> Any:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        import tiktoken
+
+                        self._encoding = tiktoken.get_encoding(self._encoding_name)
+                    except Exception as e:
+                        _logger.warning(
+                            "Could not load the [%s] encoding, estimating token counts from characters %s",
+                            self._encoding_name,
+                            e,
+                        )
+                    self._loaded = True
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return (len(text) + self._chars_per_token - 1) // self._chars_per_token
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def count_messages(self, messages: List[BaseMessage]) -> int:
+        return self._tokens_per_reply + sum(
+            self._tokens_per_message + self.count(str(message.content))
+            for message in messages
+        )
+
+
+class ModelTier(BaseModel):
+    model: str
+    # Largest prompt routed to the tier, None for the long context fallback
+    max_prompt_tokens: Union[int, None] = None
+    # An OpenAI compatible endpoint serving the model, the OpenAI API when None
+    base_url: Union[str, None] = None
+
+    @classmethod
+    def parse(cls, spec: str, max_prompt_tokens: Union[int, None] = None) -> ModelTier:
+        """
+        :param spec: `model` or `model@base_url`
+        """
+        (model, _, base_url) = spec.strip().partition("@")
+        if not model:
+            raise ValueError(f"Model tier [{spec}] has no model")
+        return cls(
+            model=model, max_prompt_tokens=max_prompt_tokens, base_url=base_url or None
+        )
+
+
+class ModelRouter:
+    """
+    Picks the cheapest tier whose `max_prompt_tokens` fits the prompt, prompts larger than every tier go to
+    the long context model. Tiers are given as `max_prompt_tokens=model[@base_url]` separated by commas, e.g.
+    `3000=gpt-3.5-turbo,6000=llama-2-13b@http://localhost:8080/v1`.
+    """
+
+    _tiers: List[ModelTier]
+    _long_context: ModelTier
+    _counter: TokenCounter
+
+    def __init__(self, tiers: str, long_context: str, counter: TokenCounter):
+        self._tiers = sorted(
+            self._parse_tiers(tiers), key=lambda tier: tier.max_prompt_tokens or 0
+        )
+        self._long_context = ModelTier.parse(long_context)
+        self._counter = counter
+
+    @classmethod
+    def _parse_tiers(cls, tiers: str) -> List[ModelTier]:
+        """
+        :raise ValueError: When a tier is not of the form `max_prompt_tokens=model[@base_url]`
+        """
+        parsed = list()
+        for spec in filter(None, (spec.strip() for spec in tiers.split(","))):
+            (max_prompt_tokens, sep, model) = spec.partition("=")
+            if not sep or not max_prompt_tokens.strip().isdigit():
+                raise ValueError(
+                    f"Model tier [{spec}] is not of the form max_prompt_tokens=model[@base_url]"
+                )
+            parsed.append(ModelTier.parse(model, int(max_prompt_tokens)))
+        return parsed
+
+    @property
+    def tiers(self) -> List[ModelTier]:
+        return self._tiers + [self._long_context]
+
+    def route(self, messages: List[BaseMessage]) -> Tuple[ModelTier, int]:
+        """
+        The tier for the prompt and its token count
+        """
+        tokens = self._counter.count_messages(messages)
+        for tier in self._tiers:
+            if tier.max_prompt_tokens is not None and tokens <= tier.max_prompt_tokens:
+                return (tier, tokens)
+        return (self._long_context, tokens)
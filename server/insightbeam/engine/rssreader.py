@@ -1,67 +1,394 @@
 from __future__ import annotations
 
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, List, Tuple, Union
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing.context import BaseContext
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Tuple, Union
 
-import feedparser  # type: ignore[import]
-import newspaper  # type: ignore[import]
+from pydantic import BaseModel
 
 from insightbeam.common import Article
 from insightbeam.config import Configuration
+from insightbeam.engine.htmlcache import HtmlCache
+
+if TYPE_CHECKING:
+    import newspaper  # type: ignore[import]
 
 _logger = logging.getLogger(__name__)
 
 
+def _build_newspaper_config(options: Dict[str, Any]) -> newspaper.Config:
+    import newspaper  # type: ignore[import]
+
+    config = newspaper.Config()
+    for name, value in options.items():
+        setattr(config, name, value)
+    return config
+
+
+def extract_article(
+    url: str,
+    html: str,
+    feed_title: Union[str, None] = None,
+    newspaper_options: Union[Dict[str, Any], None] = None,
+) -> Article:
+    """
+    CPU bound extraction of an already downloaded article, runs inside the extraction process pool. `feed_title`
+    is given when `html` is the full text carried by the feed entry rather than the article page. The newspaper
+    config is rebuilt from `newspaper_options` (plain values, they are pickled over to the pool).
+    """
+    if feed_title is not None:
+        import bs4
+
+        text = bs4.BeautifulSoup(html, features="lxml").get_text("\n")
+        paragraphs = [line.strip() for line in text.splitlines() if line.strip()]
+        return Article(content="\n\n".join(paragraphs), title=feed_title, url=url)
+
+    # newspaper (and nltk with it) is slow to import, only extraction processes need it
+    import newspaper  # type: ignore[import]
+
+    article = newspaper.Article(
+        url=url, config=_build_newspaper_config(newspaper_options or dict())
+    )
+    article.download(input_html=html)
+    article.parse()
+    return Article(content=article.text, title=article.title, url=article.url)
+
+
+def _extract_context() -> BaseContext:
+    """
+    The pool is created once the server already runs threads (index writer, ledger, request threads), a forked
+    child could inherit a lock one of them holds. Extraction processes are forked from a single threaded fork
+    server instead, which has this module preloaded.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
 class RSSReader:
+    """
+    Loads the articles of a feed in two stages, a thread pool downloads the article html (I/O) and hands it over
+    a bounded queue to a process pool that extracts the article text (CPU) so extraction never holds the GIL of
+    the API process.
+
+    Entries that already carry the full article text in the feed (`content:encoded`) are extracted from the feed
+    directly, only summary-only entries are downloaded. Downloaded html is kept in an on disk cache so retries,
+    re-pulls and re-extraction don't hit the origin again.
+    """
+
+    _newspaper_options: Dict[str, Any]
     _newspaper_config: newspaper.Config
+    _download_workers: int
+    _extract_workers: int
+    _extract_queue_size: int
+    _extract_pool: Union[ProcessPoolExecutor, None]
+    _extract_pool_lock: threading.Lock
+    _html_cache: HtmlCache
+    _fulltext_min_words: int
+    _fulltext_min_paragraphs: int
+    _tag_re = re.compile(r"<[^>]+>")
+    _paragraph_re = re.compile(r"<(?:p|br)[\s/>]", re.IGNORECASE)
+    _source_stats: Dict[str, LoadStats]
+    _source_stats_lock: threading.Lock
 
     def __init__(self, cfg: Configuration):
-        self._newspaper_config = newspaper.Config()
-        self._newspaper_config.request_timeout = cfg.dep_call_timeout
-        self._newspaper_config.browser_user_agent = cfg.browser_agent
-
-    def load_source_item(self, url: str) -> newspaper.Article:
-        if url != "":
-            article = newspaper.Article(url=url, config=self._newspaper_config)
-            article.download()
-            article.parse()
-            return article
-        else:
-            ValueError("Cannot retrieve article for an empty string")
+        self._newspaper_options = {
+            "request_timeout": cfg.dep_call_timeout,
+            "browser_user_agent": cfg.browser_agent,
+        }
+        self._newspaper_config = _build_newspaper_config(self._newspaper_options)
+        self._download_workers = cfg.download_workers
+        self._extract_workers = cfg.extract_workers or os.cpu_count() or 1
+        self._extract_queue_size = cfg.extract_queue_size
+        self._extract_pool = None
+        self._extract_pool_lock = threading.Lock()
+        self._html_cache = HtmlCache(cfg)
+        self._fulltext_min_words = cfg.feed_fulltext_min_words
+        self._fulltext_min_paragraphs = cfg.feed_fulltext_min_paragraphs
+        self._source_stats = dict()
+        self._source_stats_lock = threading.Lock()
+
+    def _get_extract_pool(self) -> ProcessPoolExecutor:
+        with self._extract_pool_lock:
+            if self._extract_pool is None:
+                self._extract_pool = ProcessPoolExecutor(
+                    max_workers=self._extract_workers, mp_context=_extract_context()
+                )
+            return self._extract_pool
+
+    def _discard_extract_pool(self, pool: ProcessPoolExecutor):
+        """
+        A pool whose process died (e.g. killed by the OOM killer) rejects every task, the next extraction
+        builds a new one
+        """
+        with self._extract_pool_lock:
+            if self._extract_pool is pool:
+                self._extract_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        with self._extract_pool_lock:
+            if self._extract_pool is not None:
+                self._extract_pool.shutdown(cancel_futures=True)
+                self._extract_pool = None
+        self._html_cache.close()
+
+    def download_source_item(self, url: str) -> str:
+        """
+        :raise ValueError: When the url is empty
+        :raise requests.RequestException: When the article could not be downloaded
+        """
+        return self._download(url)[0]
+
+    def _download(self, url: str) -> Tuple[str, bool]:
+        """
+        The article html and whether it was served from the html cache
+        """
+        if url == "":
+            raise ValueError("Cannot retrieve article for an empty string")
+
+        cached = self._html_cache.get(url)
+        if cached is not None:
+            return (cached, True)
+
+        import requests  # type: ignore[import]
+        from newspaper import network  # type: ignore[import]
+
+        cfg = self._newspaper_config
+        response = requests.get(
+            url,
+            **network.get_request_kwargs(
+                cfg.request_timeout, cfg.browser_user_agent, cfg.proxies, cfg.headers
+            ),
+        )
+        response.raise_for_status()
+        html = network.get_html_2XX_only(url, cfg, response=response)
+        if isinstance(html, bytes):
+            html = html.decode("utf-8", errors="replace")
+
+        self._html_cache.put(url, html, response.headers.get("Cache-Control"))
+        return (html, False)
+
+    def load_source_item(self, url: str) -> Article:
+        return extract_article(
+            url,
+            self.download_source_item(url),
+            newspaper_options=self._newspaper_options,
+        )
+
+    def _extract_articles(
+        self,
+        downloads: Iterable[Tuple[str, Union[str, None], Union[str, None]]],
+        published: Union[Dict[str, datetime], None] = None,
+    ) -> Tuple[List[Article], List[str]]:
+        """
+        Extract (url, html, feed_title) in the process pool as they come in, a None html counts as failed. The
+        articles are dated from `published` by the url they were submitted under. `downloads` is always consumed
+        to the end, when the pool breaks the remaining articles count as failed.
+        """
+        items: List[Article] = list()
+        failed: List[str] = list()
+        pool = self._get_extract_pool()
+        extracting: Dict[Future, str] = dict()
+        broken = False
+
+        def collect(return_when: str):
+            nonlocal broken
+            (done, _pending) = wait(extracting, return_when=return_when)
+            for extract_task in done:
+                article_url = extracting.pop(extract_task)
+                try:
+                    article = extract_task.result()
+                    if published is not None:
+                        article.published = published.get(article_url)
+                    items.append(article)
+                except Exception as e:
+                    _logger.warning(
+                        "Error extracting article for: (url) (%s) %s", article_url, e
+                    )
+                    failed.append(article_url)
+                    if isinstance(e, BrokenProcessPool) and not broken:
+                        broken = True
+                        self._discard_extract_pool(pool)
+
+        for article_url, html, feed_title in downloads:
+            if html is None or broken:
+                failed.append(article_url)
+                continue
+
+            try:
+                extract_task = pool.submit(
+                    extract_article,
+                    article_url,
+                    html,
+                    feed_title,
+                    self._newspaper_options,
+                )
+            except BrokenProcessPool as e:
+                _logger.warning("Extraction pool is broken %s", e)
+                broken = True
+                self._discard_extract_pool(pool)
+                failed.append(article_url)
+                continue
+            extracting[extract_task] = article_url
+            # Bound the extractions in flight, producers of `downloads` wait meanwhile
+            while len(extracting) >= self._extract_queue_size:
+                collect(FIRST_COMPLETED)
+
+        if len(extracting) > 0:
+            collect(ALL_COMPLETED)
+        return (items, failed)
+
+    def reprocess_cached(self) -> Tuple[List[Article], List[str]]:
+        """
+        Extract every article in the html cache again, without any network access
+        """
+        return self._extract_articles(
+            (url, html, None) for (url, html) in self._html_cache.items()
+        )
+
+    def _feed_full_text(self, entry: Dict) -> Union[str, None]:
+        """
+        The html of the entry's full text when it is substantive enough to skip downloading the article
+        """
+        contents: List[Dict] = entry.get("content", [])
+        html = max((c.get("value", "") for c in contents), key=len, default="")
+        words = len(self._tag_re.sub(" ", html).split())
+        paragraphs = len(self._paragraph_re.findall(html))
+
+        if (
+            words >= self._fulltext_min_words
+            and paragraphs >= self._fulltext_min_paragraphs
+        ):
+            return html
+        return None
+
+    def _entry_published(self, entry: Dict) -> Union[datetime, None]:
+        """
+        The entry's publication (or last update) date in naive UTC, feedparser normalizes the feed's dates to UTC
+        """
+        parsed: Union[time.struct_time, None] = entry.get(
+            "published_parsed"
+        ) or entry.get("updated_parsed")
+        if parsed is None:
+            return None
+        try:
+            return datetime(*parsed[:6])
+        except ValueError:
+            return None
+
+    def source_stats(self, url: str) -> LoadStats:
+        """
+        Totals over every load of the feed since the reader started
+        """
+        with self._source_stats_lock:
+            return self._source_stats.get(url, LoadStats()).model_copy()
+
+    def _record_stats(self, url: str, stats: LoadStats):
+        with self._source_stats_lock:
+            total = self._source_stats.setdefault(url, LoadStats())
+            for field in LoadStats.model_fields:
+                setattr(total, field, getattr(total, field) + getattr(stats, field))
 
     def load_source_items(
         self, url: str, limit: Union[int, None] = None
-    ) -> Tuple[List[Article], List[str]]:
-        items = list()
-        failed = list()
+    ) -> Tuple[List[Article], List[str], LoadStats]:
+        import feedparser  # type: ignore[import]
+
         feed: Dict = feedparser.parse(url)
 
         entries: List[Dict] = feed.get("entries", [])
         if limit is not None and isinstance(limit, int):
             entries = entries[:limit]
 
-        with ThreadPoolExecutor(max_workers=len(entries)) as tpe:
-            retrieve_article_tasks = {
-                tpe.submit(self.load_source_item, entry.get("link", "")): entry.get(
-                    "link", ""
-                )
-                for entry in entries
-            }
+        stats = LoadStats(entries=len(entries))
+        from_feed: List[Tuple[str, Union[str, None], Union[str, None]]] = list()
+        to_download: List[str] = list()
+        published: Dict[str, datetime] = dict()
+        for entry in entries:
+            article_url = entry.get("link", "")
+            entry_published = self._entry_published(entry)
+            if entry_published is not None:
+                published[article_url] = entry_published
+            full_text = self._feed_full_text(entry)
+            if full_text is not None and article_url != "":
+                from_feed.append((article_url, full_text, entry.get("title", "")))
+            else:
+                to_download.append(article_url)
+        stats.from_feed = len(from_feed)
 
-            for retrieve_article_task in as_completed(retrieve_article_tasks):
-                url = retrieve_article_tasks.get(retrieve_article_task, "")
+        downloaded: queue.Queue = queue.Queue(maxsize=self._extract_queue_size)
+        abandoned = threading.Event()
 
-                if not isinstance(url, str) or url == "":
-                    raise ValueError("Cannot retrieve article for an empty string")
+        def hand_over(download: Tuple[str, Union[str, None], bool]):
+            # Gives up once nothing reads the queue anymore, so the download threads always finish
+            while not abandoned.is_set():
                 try:
-                    article = retrieve_article_task.result()
-                    item = Article(
-                        content=article.text, title=article.title, url=article.url
-                    )
-                    items.append(item)
-                except Exception as e:
-                    _logger.warn("Error retrieving article for: (url) (%s)", url, e)
-                    failed.append(url)
+                    downloaded.put(download, timeout=0.5)
+                    return
+                except queue.Full:
+                    pass
 
-        return (items, failed)
+        def download(article_url: str):
+            if abandoned.is_set():
+                return
+            try:
+                hand_over((article_url, *self._download(article_url)))
+            except Exception as e:
+                _logger.warning(
+                    "Error downloading article for: (url) (%s) %s", article_url, e
+                )
+                hand_over((article_url, None, False))
+
+        def downloads() -> Iterator[Tuple[str, Union[str, None], Union[str, None]]]:
+            yield from from_feed
+            for _ in to_download:
+                (article_url, html, cached) = downloaded.get()
+                if cached:
+                    stats.cached += 1
+                elif html is not None:
+                    stats.downloaded += 1
+                yield (article_url, html, None)
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(self._download_workers, len(to_download)))
+        ) as tpe:
+            for article_url in to_download:
+                tpe.submit(download, article_url)
+            try:
+                (items, failed) = self._extract_articles(downloads(), published)
+            finally:
+                abandoned.set()
+
+        stats.failed = len(failed)
+        self._record_stats(url, stats)
+        _logger.info("Loaded feed (url) (%s) %s", url, stats)
+        return (items, failed, stats)
+
+
+class LoadStats(BaseModel):
+    entries: int = 0
+    # Entries whose full text came with the feed, no download needed
+    from_feed: int = 0
+    # Entries served from the html cache
+    cached: int = 0
+    downloaded: int = 0
+    failed: int = 0
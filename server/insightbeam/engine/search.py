@@ -1,69 +1,150 @@
 from __future__ import annotations
 
-import os
-from logging import Logger
-from typing import Any, Callable, List, TypeVar
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Set, TypeVar, Union
 
 from pydantic import BaseModel
-from whoosh.fields import ID, TEXT, Schema  # type: ignore[import]
-from whoosh.index import Index, create_in, exists_in, open_dir  # type: ignore[import]
-from whoosh.qparser import OrGroup, QueryParser  # type: ignore[import]
-from whoosh.writing import IndexWriter  # type: ignore[import]
 
 from insightbeam.config import Configuration
+from insightbeam.engine.indexing import BufferedIndexWriter
 
-_logger = Logger(__name__)
+_logger = logging.getLogger(__name__)
 T = TypeVar("T")
 
 
-class SearchEngine:
-    _schema = Schema(
-        content=TEXT,
-        title=TEXT(stored=True),
-        uuid=ID(stored=True, analyzer=None),
-        url=TEXT(stored=True, analyzer=None),
-    )
-    _ix: Index
-    _parser: QueryParser
-
-    def __init__(self, cfg: Configuration, clean=True):
-        path = cfg.sengine_dir
-        if not os.path.exists(path):
-            os.mkdir(path)
-
-        if clean or not exists_in(path):
-            self._ix = create_in(path, self._schema)
-        elif exists_in(path) and not clean:
-            self._ix = open_dir(path)
-
-        self._parser = QueryParser("content", self._schema, group=OrGroup.factory(0.8))
-
-    def _add_document(
-        self, writer: IndexWriter, item: Any, transform: Callable[[T], Input]
-    ):
-        writer.add_document(**transform(item).model_dump())
+class SearchEngine(ABC):
+    """
+    Retrieves related source items, implemented by the whoosh (BM25) and the tf-idf retrievers.
+
+    Writes never happen on the caller's thread, `add_documents` hands the documents to a single background
+    writer which commits them in batches. A read-only engine searches an index written by another process and
+    ignores `add_documents`, `refresh` picks up what that process has committed since.
+
+    `search_item` only considers documents published within the configured window of the item's own date and
+    halves their scores every half-life apart from it. Documents without a date (indexed before dates were kept)
+    are always considered and never decayed.
+    """
+
+    _writer: Union[BufferedIndexWriter[Input], None] = None
+    _window: Union[timedelta, None] = None
+    _half_life: Union[timedelta, None] = None
+
+    def _configure_recency(self, cfg: Configuration):
+        if cfg.search_window_days is not None:
+            self._window = timedelta(days=cfg.search_window_days)
+        if cfg.search_half_life_days is not None:
+            self._half_life = timedelta(days=cfg.search_half_life_days)
+
+    def _recency_anchor(self, item: Input) -> datetime:
+        """
+        The date related documents are measured from, the item's publication date or else now
+        """
+        return item.published or datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def _recency_decay(
+        self, published: Union[datetime, None], anchor: datetime
+    ) -> float:
+        """
+        Documents without a date (indexed before dates were kept) are not decayed
+        """
+        if self._half_life is None or published is None:
+            return 1.0
+        distance = abs((published - anchor).total_seconds())
+        return 0.5 ** (distance / self._half_life.total_seconds())
+
+    def _start_writer(self, cfg: Configuration):
+        self._writer = BufferedIndexWriter(
+            self._commit,
+            self._optimize,
+            batch_size=cfg.sengine_batch_size,
+            flush_interval=cfg.sengine_flush_interval,
+            queue_size=cfg.sengine_queue_size,
+            optimize_hour=cfg.sengine_optimize_hour,
+            name=f"{type(self).__name__}-writer",
+        )
+
+    @property
+    def read_only(self) -> bool:
+        return self._writer is None
+
+    def promote(self, cfg: Configuration):
+        """
+        Start writing to the index, e.g. once the process that used to write it has gone away
+        """
+        if self._writer is None:
+            self.refresh()
+            self._start_writer(cfg)
 
     def add_documents(self, items: List[T], transform: Callable[[T], Input]):
-        try:
-            writer: IndexWriter = self._ix.writer()
-            [self._add_document(writer, item, transform) for item in items]
-            writer.commit()
-        except Exception as e:
-            _logger.error("Exception raised adding documents to the index %s", e)
-            writer.cancel()
-
-    def search(self, query_expr: str) -> List[SearchResult]:
-        with self._ix.searcher() as s:
-            query = self._parser.parse(query_expr)
-            results = s.search(query, terms=True)
-            return [
-                SearchResult(
-                    article_uuid=hit["uuid"],
-                    article_title=hit["title"],
-                    matched_terms=[t for (_, t) in hit.matched_terms()],
-                )
-                for hit in results
-            ]
+        if self._writer is None:
+            # The writing process indexes them from the database
+            return
+        self._writer.put([transform(item) for item in items])
+
+    def flush(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Wait until the documents added so far are searchable
+        """
+        if self._writer is None:
+            self.refresh()
+            return True
+        return self._writer.flush(timeout)
+
+    def close(self, timeout: Union[float, None] = None):
+        if self._writer is not None:
+            self._writer.close(timeout)
+
+    def refresh(self):
+        """
+        Pick up the index generations committed by another process
+        """
+        ...
+
+    @abstractmethod
+    def indexed_uuids(self) -> Set[str]:
+        ...
+
+    @abstractmethod
+    def _commit(self, inputs: List[Input]):
+        """
+        Called from the writer thread only
+        """
+        ...
+
+    def _optimize(self):
+        ...
+
+    @abstractmethod
+    def search(self, query_expr: str, limit: int = 10) -> List[SearchResult]:
+        ...
+
+    @abstractmethod
+    def search_item(self, item: Input, limit: int = 10) -> List[SearchResult]:
+        """
+        Search for documents similar to a whole item, the item itself is excluded from the results
+        """
+        ...
+
+
+def create_search_engine(
+    cfg: Configuration, clean=True, read_only=False
+) -> SearchEngine:
+    """
+    :raise ValueError: When the configured retriever is not supported
+    """
+    # The retrievers (and numpy, whoosh with them) are only imported once one is built
+    if cfg.search_retriever == "whoosh":
+        from insightbeam.engine.bm25 import WhooshSearchEngine
+
+        return WhooshSearchEngine(cfg, clean=clean, read_only=read_only)
+    elif cfg.search_retriever == "tfidf":
+        from insightbeam.engine.tfidf import TfidfSearchEngine
+
+        return TfidfSearchEngine(cfg, clean=clean, read_only=read_only)
+    else:
+        raise ValueError(f"Unsupported search retriever [{cfg.search_retriever}]")
 
 
 class Input(BaseModel):
@@ -71,9 +152,13 @@ class Input(BaseModel):
     url: str
     title: str
     content: str
+    # Naive UTC
+    published: Union[datetime, None] = None
 
 
 class SearchResult(BaseModel):
     article_uuid: str
     article_title: str
     matched_terms: List[str]
+    score: float = 0.0
+    published: Union[datetime, None] = None
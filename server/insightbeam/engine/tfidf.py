@@ -0,0 +1,617 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Set, Tuple, Union
+
+import numpy as np
+from whoosh.analysis import StandardAnalyzer  # type: ignore[import]
+
+from insightbeam.config import Configuration
+from insightbeam.engine.search import Input, SearchEngine, SearchResult
+
+_logger = logging.getLogger(__name__)
+
+
+class _Segment:
+    """
+    An immutable batch of documents of the tf-idf index.
+
+    Term ids are global and only ever appended to, a segment keeps the terms it introduced (ids from
+    `first_term` on). Term counts are kept doc-major (csr) for merging and for the document norms, the log term
+    frequencies are kept term-major (csc) so a query only touches the postings of its own terms. Nothing in a
+    segment depends on the rest of the index, idf and the norms are derived when searching.
+    """
+
+    name: str
+    docs: List[Dict[str, Any]]
+    terms: List[str]
+    first_term: int
+    # Publication date of every document in epoch seconds, NaN when unknown
+    published: np.ndarray
+    df: np.ndarray
+    count_indptr: np.ndarray
+    count_terms: np.ndarray
+    counts: np.ndarray
+    post_indptr: np.ndarray
+    post_docs: np.ndarray
+    post_tf: np.ndarray
+
+    _arrays = [
+        "count_indptr",
+        "count_terms",
+        "counts",
+        "post_indptr",
+        "post_docs",
+        "post_tf",
+    ]
+
+    def __init__(
+        self,
+        name: str,
+        docs: List[Dict[str, Any]],
+        terms: List[str],
+        first_term: int,
+        **arrays,
+    ):
+        self.name = name
+        self.docs = docs
+        self.terms = terms
+        self.first_term = first_term
+        self.published = np.array(
+            [doc.get("published") for doc in docs], dtype=np.float64
+        )
+        for array_name in self._arrays:
+            setattr(self, array_name, arrays[array_name])
+        self.df = np.diff(self.post_indptr)
+
+    @property
+    def n_terms(self) -> int:
+        """
+        Number of terms known when the segment was written, its postings cover ids below it
+        """
+        return self.first_term + len(self.terms)
+
+    @classmethod
+    def build(
+        cls,
+        name: str,
+        docs: List[Dict[str, Any]],
+        terms: List[str],
+        first_term: int,
+        count_indptr: np.ndarray,
+        count_terms: np.ndarray,
+        counts: np.ndarray,
+    ) -> _Segment:
+        n_terms = first_term + len(terms)
+        entry_docs = np.repeat(
+            np.arange(len(docs), dtype=np.int32), np.diff(count_indptr)
+        )
+        order = np.argsort(count_terms, kind="stable")
+        post_indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(count_terms, minlength=n_terms), out=post_indptr[1:])
+
+        return cls(
+            name,
+            docs,
+            terms,
+            first_term,
+            count_indptr=count_indptr,
+            count_terms=count_terms,
+            counts=counts,
+            post_indptr=post_indptr,
+            post_docs=entry_docs[order],
+            post_tf=(1 + np.log(counts[order])).astype(np.float32),
+        )
+
+    @classmethod
+    def merge(cls, name: str, segments: List[_Segment]) -> _Segment:
+        """
+        Segments adjacent in the index, in their order
+        """
+        offsets = np.cumsum([0] + [s.count_indptr[-1] for s in segments[:-1]])
+        return cls.build(
+            name,
+            [doc for s in segments for doc in s.docs],
+            [term for s in segments for term in s.terms],
+            segments[0].first_term,
+            np.concatenate(
+                [np.zeros(1, np.int64)]
+                + [
+                    s.count_indptr[1:] + offset
+                    for (s, offset) in zip(segments, offsets)
+                ]
+            ),
+            np.concatenate([s.count_terms for s in segments]),
+            np.concatenate([s.counts for s in segments]),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> _Segment:
+        with open(os.path.join(path, "segment.json")) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in cls._arrays
+        }
+        return cls(
+            os.path.basename(path),
+            meta["docs"],
+            meta["terms"],
+            meta["first_term"],
+            **arrays,
+        )
+
+    def save(self, path: str):
+        """
+        Written next to `path` and renamed, a segment directory is always complete. Whatever is at `path` is
+        replaced.
+        """
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        with open(os.path.join(tmp_path, "segment.json"), "w") as f:
+            json.dump(
+                {"docs": self.docs, "terms": self.terms, "first_term": self.first_term},
+                f,
+            )
+        for name in self._arrays:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), getattr(self, name))
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_path, path)
+
+    def norms(self, idf: np.ndarray) -> np.ndarray:
+        entry_docs = np.repeat(
+            np.arange(len(self.docs), dtype=np.int32), np.diff(self.count_indptr)
+        )
+        weights = (1 + np.log(self.counts)) * idf[self.count_terms]
+        return np.sqrt(
+            np.bincount(entry_docs, weights=weights**2, minlength=len(self.docs))
+        )
+
+
+class _Snapshot:
+    """
+    The segments of one generation of the index and the statistics searches need across them. The document
+    norms depend on the idf of every term, they are computed by the first search of the generation.
+    """
+
+    segments: List[_Segment]
+    n_terms: int
+    n_docs: int
+    offsets: np.ndarray
+    # Publication date of every document across the segments, epoch seconds or NaN
+    published: np.ndarray
+    idf: np.ndarray
+    _norms: Union[List[np.ndarray], None]
+    _norms_lock: threading.Lock
+
+    def __init__(self, segments: List[_Segment], n_terms: int):
+        self.segments = segments
+        self.n_terms = n_terms
+        self.n_docs = sum(len(s.docs) for s in segments)
+        self.offsets = np.cumsum([0] + [len(s.docs) for s in segments])
+        self.published = np.concatenate(
+            [np.zeros(0, dtype=np.float64)] + [s.published for s in segments]
+        )
+        df = np.zeros(n_terms, dtype=np.int64)
+        for s in segments:
+            df[: s.n_terms] += s.df
+        self.idf = (np.log((1 + self.n_docs) / (1 + df)) + 1).astype(np.float32)
+        self._norms = None
+        self._norms_lock = threading.Lock()
+
+    def norms(self) -> List[np.ndarray]:
+        if self._norms is None:
+            with self._norms_lock:
+                if self._norms is None:
+                    self._norms = [s.norms(self.idf) for s in self.segments]
+        return self._norms
+
+    def locate(self, doc: int) -> Tuple[_Segment, int]:
+        i = int(np.searchsorted(self.offsets, doc, side="right")) - 1
+        return (self.segments[i], doc - int(self.offsets[i]))
+
+
+class TfidfSearchEngine(SearchEngine):
+    """
+    Cosine similarity over a sparse tf-idf matrix of the source item contents. The matrix is persisted as numpy
+    arrays under `<sengine_dir>/tfidf` and memory-mapped on load.
+
+    Each commit appends a segment holding only the new documents and writes a manifest of the segments as a new
+    generation, then moves the `CURRENT` pointer to it. Read-only engines in other processes switch over on
+    their next search, loading only the segments they don't hold yet. The last segments are merged while the
+    one before is no larger than the newest, which keeps the number of segments logarithmic and the total
+    indexing work at O(n log n). The daily optimization merges them all.
+    """
+
+    _analyzer = StandardAnalyzer()
+    _item_query_terms = 20
+    _current_file = "CURRENT"
+    _refresh_interval = 1.0
+    _path: str
+    _terms: List[str]
+    _vocab: Dict[str, int]
+    _indexed: Set[str]
+    _snapshot: _Snapshot
+    _generation: int
+    _refreshed_at: float
+    # Held while a generation is loaded and installed, refreshes come from request threads and the synchronizer
+    _install_lock: threading.Lock
+
+    def __init__(self, cfg: Configuration, clean=True, read_only=False):
+        self._path = os.path.join(cfg.sengine_dir, "tfidf")
+        self._refreshed_at = time.monotonic()
+        self._install_lock = threading.Lock()
+        self._terms = list()
+        self._vocab = dict()
+        self._indexed = set()
+        self._generation = 0
+        self._snapshot = _Snapshot([], 0)
+
+        if clean and not read_only and os.path.exists(self._path):
+            shutil.rmtree(self._path)
+        os.makedirs(self._path, exist_ok=True)
+
+        self.refresh()
+        if not read_only and self._read_current() not in (None, self._generation):
+            _logger.warning(
+                "tf-idf index at %s was written in an older format, rebuilding it",
+                self._path,
+            )
+            shutil.rmtree(self._path)
+            os.makedirs(self._path)
+        elif not read_only:
+            self._remove_unreferenced()
+        self._configure_recency(cfg)
+        if not read_only:
+            self._start_writer(cfg)
+
+    def refresh(self):
+        self._refreshed_at = time.monotonic()
+        with self._install_lock:
+            current = self._read_current()
+            if current is None or current <= self._generation:
+                return
+
+            try:
+                segments = self._load_generation(current)
+            except FileNotFoundError:
+                # Superseded (and removed) by a newer generation while loading, the next refresh gets that one
+                return
+            if segments is not None:
+                self._install(current, segments)
+
+    def indexed_uuids(self) -> Set[str]:
+        return set(self._indexed)
+
+    def _manifest_path(self, generation: int) -> str:
+        return os.path.join(self._path, f"gen-{generation}.json")
+
+    def _segment_path(self, name: str) -> str:
+        return os.path.join(self._path, name)
+
+    def _read_current(self) -> Union[int, None]:
+        current_path = os.path.join(self._path, self._current_file)
+        if not os.path.exists(current_path):
+            return None
+        with open(current_path) as f:
+            return int(f.read().strip())
+
+    def _write_current(self, generation: int):
+        tmp_path = os.path.join(self._path, f"{self._current_file}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(str(generation))
+        os.replace(tmp_path, os.path.join(self._path, self._current_file))
+
+    def _remove_unreferenced(self):
+        """
+        Remove the segments and manifests the current generation does not use, left by a writer that stopped
+        between saving them and moving `CURRENT`
+        """
+        keep = set(s.name for s in self._snapshot.segments)
+        keep.update(
+            [self._current_file, os.path.basename(self._manifest_path(self._generation))]
+        )
+        for name in os.listdir(self._path):
+            if name in keep or not name.startswith(("seg-", "gen-")):
+                continue
+            _logger.info("Removing unreferenced tf-idf index file %s", name)
+            path = os.path.join(self._path, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    def _load_generation(self, generation: int) -> Union[List[_Segment], None]:
+        """
+        The segments of the generation, the ones already loaded are reused. None when the generation has no
+        manifest (written by an older version).
+        """
+        manifest_path = self._manifest_path(generation)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            names = json.load(f)["segments"]
+        loaded = {s.name: s for s in self._snapshot.segments}
+        return [
+            loaded.get(name) or _Segment.load(self._segment_path(name))
+            for name in names
+        ]
+
+    def _install(self, generation: int, segments: List[_Segment]):
+        """
+        Called with `_install_lock` held. Searches read the snapshot they started with, terms are only ever
+        appended so the vocabulary stays valid for it.
+        """
+        if generation <= self._generation:
+            return
+        for segment in segments:
+            # Terms are only appended, a merged segment may repeat terms already known
+            start = len(self._terms) - segment.first_term
+            for term in segment.terms[max(start, 0) :]:  # noqa: E203
+                self._vocab[term] = len(self._terms)
+                self._terms.append(term)
+        current = set(s.name for s in self._snapshot.segments)
+        for segment in segments:
+            if segment.name not in current:
+                self._indexed.update(doc["uuid"] for doc in segment.docs)
+        n_terms = max((s.n_terms for s in segments), default=0)
+        (self._generation, self._snapshot) = (
+            generation,
+            _Snapshot(segments, n_terms),
+        )
+
+    def _term_counts(self, text: str) -> Counter[str]:
+        return Counter(token.text for token in self._analyzer(text))
+
+    def _new_segment(self, name: str, inputs: List[Input]) -> Union[_Segment, None]:
+        # The terms are only added to the vocabulary once the segment is installed, a failed commit is retried
+        first_term = len(self._terms)
+        new_terms: List[str] = list()
+        new_vocab: Dict[str, int] = dict()
+        added: Set[str] = set()
+        docs: List[Dict[str, Any]] = list()
+        row_lengths: List[int] = list()
+        row_terms: List[int] = list()
+        row_counts: List[float] = list()
+
+        for inp in inputs:
+            if inp.uuid in self._indexed or inp.uuid in added:
+                continue
+            added.add(inp.uuid)
+            term_counts = self._term_counts(f"{inp.title} {inp.content}")
+            if len(term_counts) == 0:
+                continue
+
+            for term, count in term_counts.items():
+                term_id = self._vocab.get(term, new_vocab.get(term))
+                if term_id is None:
+                    term_id = first_term + len(new_terms)
+                    new_vocab[term] = term_id
+                    new_terms.append(term)
+                row_terms.append(term_id)
+                row_counts.append(count)
+            row_lengths.append(len(term_counts))
+            docs.append(
+                {
+                    "uuid": inp.uuid,
+                    "title": inp.title,
+                    "url": inp.url,
+                    "published": _epoch(inp.published),
+                }
+            )
+
+        if len(docs) == 0:
+            return None
+        return _Segment.build(
+            name,
+            docs,
+            new_terms,
+            first_term,
+            np.concatenate(
+                [np.zeros(1, np.int64), np.cumsum(row_lengths, dtype=np.int64)]
+            ),
+            np.array(row_terms, dtype=np.int32),
+            np.array(row_counts, dtype=np.float32),
+        )
+
+    def _write_generation(self, generation: int, segments: List[_Segment]):
+        """
+        Save the segments built for this generation, point `CURRENT` to it and remove what only older generations
+        used. A directory already at a new segment's path was left by a commit that never became current, it is
+        overwritten.
+        """
+        current = set(s.name for s in self._snapshot.segments)
+        for segment in segments:
+            if segment.name not in current:
+                segment.save(self._segment_path(segment.name))
+        with open(self._manifest_path(generation), "w") as f:
+            json.dump({"segments": [s.name for s in segments]}, f)
+        self._write_current(generation)
+
+        with self._install_lock:
+            previous = self._generation
+            unused = set(s.name for s in self._snapshot.segments) - set(
+                s.name for s in segments
+            )
+            self._install(generation, segments)
+        if os.path.exists(self._manifest_path(previous)):
+            os.remove(self._manifest_path(previous))
+        for name in unused:
+            shutil.rmtree(self._segment_path(name), ignore_errors=True)
+
+    def _commit(self, inputs: List[Input]):
+        generation = self._generation + 1
+        segment = self._new_segment(f"seg-{generation}", inputs)
+        if segment is None:
+            return
+
+        segments = self._snapshot.segments + [segment]
+        merged = 0
+        while len(segments) >= 2 and len(segments[-2].docs) <= len(segments[-1].docs):
+            merged += 1
+            segments = segments[:-2] + [
+                _Segment.merge(f"seg-{generation}-{merged}", segments[-2:])
+            ]
+        self._write_generation(generation, segments)
+        _logger.info(
+            "tf-idf index generation %s holds %s documents in %s segments",
+            generation,
+            self._snapshot.n_docs,
+            len(segments),
+        )
+
+    def _optimize(self):
+        if len(self._snapshot.segments) < 2:
+            return
+        generation = self._generation + 1
+        merged = _Segment.merge(f"seg-{generation}", self._snapshot.segments)
+        self._write_generation(generation, [merged])
+        _logger.info("tf-idf index merged into a single segment")
+
+    def search(self, query_expr: str, limit: int = 10) -> List[SearchResult]:
+        return self._search(self._term_counts(query_expr), limit, None)
+
+    def search_item(self, item: Input, limit: int = 10) -> List[SearchResult]:
+        counts = self._term_counts(f"{item.title} {item.content}")
+        results = self._search(
+            counts, limit + 1, self._item_query_terms, self._recency_anchor(item)
+        )
+        return [r for r in results if r.article_uuid != item.uuid][:limit]
+
+    def _recency_weights(self, published: np.ndarray, anchor: datetime) -> np.ndarray:
+        """
+        Score multipliers of documents published at `published`, 0 outside the window and the half-life decay
+        within it. Undated documents (NaN) are neither filtered out nor decayed.
+        """
+        distance = np.abs(published - _epoch(anchor))
+        weights = np.ones(len(published))
+        if self._half_life is not None:
+            decay = 0.5 ** (distance / self._half_life.total_seconds())
+            weights = np.where(np.isnan(distance), 1.0, decay)
+        if self._window is not None:
+            outside = distance > self._window.total_seconds()
+            weights[outside & ~np.isnan(distance)] = 0.0
+        return weights
+
+    def _query_vector(
+        self, snapshot: _Snapshot, counts: Counter[str]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        known = [
+            (self._vocab[t], counts[t])
+            for t in counts
+            if self._vocab.get(t, snapshot.n_terms) < snapshot.n_terms
+        ]
+        term_ids = np.array([term_id for (term_id, _) in known], dtype=np.int64)
+        tf = np.array([count for (_, count) in known], dtype=np.float32)
+        weights = (1 + np.log(tf)) * snapshot.idf[term_ids]
+        norm = np.linalg.norm(weights)
+        return (term_ids, weights / norm if norm > 0 else weights)
+
+    def _segment_scores(
+        self,
+        segment: _Segment,
+        norms: np.ndarray,
+        idf: np.ndarray,
+        term_ids: np.ndarray,
+        query_weights: np.ndarray,
+    ) -> np.ndarray:
+        covered = term_ids < segment.n_terms
+        (term_ids, query_weights) = (term_ids[covered], query_weights[covered])
+        starts = segment.post_indptr[term_ids]
+        lengths = segment.post_indptr[term_ids + 1] - starts
+        entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(
+            lengths.sum()
+        )
+        docs = segment.post_docs[entries]
+        weights = (
+            segment.post_tf[entries]
+            * np.repeat(query_weights * idf[term_ids], lengths)
+            / norms[docs]
+        )
+        return np.bincount(docs, weights=weights, minlength=len(segment.docs))
+
+    def _search(
+        self,
+        counts: Counter[str],
+        limit: int,
+        max_terms: Union[int, None],
+        anchor: Union[datetime, None] = None,
+    ) -> List[SearchResult]:
+        if (
+            self.read_only
+            and time.monotonic() - self._refreshed_at >= self._refresh_interval
+        ):
+            self.refresh()
+
+        snapshot = self._snapshot
+        (term_ids, query_weights) = self._query_vector(snapshot, counts)
+        if max_terms is not None and len(term_ids) > max_terms:
+            keep = np.argpartition(-query_weights, max_terms - 1)[:max_terms]
+            (term_ids, query_weights) = (term_ids[keep], query_weights[keep])
+        if snapshot.n_docs == 0 or len(term_ids) == 0 or limit <= 0:
+            return []
+
+        norms = snapshot.norms()
+        scores = np.concatenate(
+            [
+                self._segment_scores(
+                    segment, segment_norms, snapshot.idf, term_ids, query_weights
+                )
+                for (segment, segment_norms) in zip(snapshot.segments, norms)
+            ]
+        )
+        if anchor is not None:
+            matched = np.flatnonzero(scores)
+            scores[matched] *= self._recency_weights(
+                snapshot.published[matched], anchor
+            )
+
+        k = min(limit, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = list()
+        for doc in top:
+            (segment, local) = snapshot.locate(int(doc))
+            results.append(
+                SearchResult(
+                    article_uuid=segment.docs[local]["uuid"],
+                    article_title=segment.docs[local]["title"],
+                    matched_terms=self._matched_terms(segment, local, term_ids),
+                    score=float(scores[doc]),
+                    published=_from_epoch(segment.published[local]),
+                )
+            )
+        return results
+
+    def _matched_terms(
+        self, segment: _Segment, doc: int, term_ids: np.ndarray
+    ) -> List[str]:
+        start, end = segment.count_indptr[doc], segment.count_indptr[doc + 1]
+        matched = np.intersect1d(segment.count_terms[start:end], term_ids)
+        return [self._terms[t] for t in matched]
+
+
+def _epoch(published: Union[datetime, None]) -> Union[float, None]:
+    """
+    Seconds since the epoch of a naive UTC datetime
+    """
+    if published is None:
+        return None
+    return published.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _from_epoch(seconds: float) -> Union[datetime, None]:
+    if np.isnan(seconds):
+        return None
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,26 @@
+"""
+Re-extract the content of every stored source item from the html cache without network access, useful after
+changing the extraction settings. Run with `python -m insightbeam.reprocess`.
+"""
+from sqlalchemy.orm import Session
+
+import insightbeam.core as core
+from insightbeam.config import Configuration
+from insightbeam.dal import initialize_engine
+from insightbeam.engine.rssreader import RSSReader
+
+
+def main():
+    cfg = Configuration()
+    db_engine = initialize_engine(cfg)
+    reader = RSSReader(cfg)
+    try:
+        with Session(db_engine) as session:
+            updated = core.reprocess_cached_items(reader, session)
+        print(f"Re-extracted {updated} source items from the html cache")
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+from sqlalchemy.orm import Session
+
+import insightbeam.dal as dal
+from benchmarks import seed_database
+from insightbeam.engine.interpreter import ArticleAnalysis
+
+
+def test_add_source_item_analysis_keeps_the_first_analysis(tmp_path):
+    db_engine = seed_database(f"sqlite+pysqlite:///{tmp_path}/sqlite.db", 2, sources=1)
+    first = ArticleAnalysis(article_url="https://example.com/1", error="first")
+    second = ArticleAnalysis(article_url="https://example.com/1", error="second")
+
+    with Session(db_engine) as session:
+        assert dal.add_source_item_analysis(session, 1, first) == first
+        assert dal.add_source_item_analysis(session, 1, second) == first
+        assert dal.add_source_item_counter_analysis(session, 1, second) == second
+        assert dal.add_source_item_counter_analysis(session, 1, first) == second
+        assert dal.get_source_item_analysis(session, 1) == first.model_dump_json()
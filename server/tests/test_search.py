@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from benchmarks import bench_config
+from insightbeam.engine.search import Input, create_search_engine
+
+
+@pytest.mark.parametrize("retriever", ["whoosh", "tfidf"])
+def test_search_item_keeps_undated_documents_in_window(tmp_path, retriever):
+    cfg = bench_config(
+        sengine_dir=str(tmp_path),
+        search_retriever=retriever,
+        search_window_days=30,
+        search_half_life_days=7,
+    )
+    anchor = datetime(2023, 10, 1)
+    sengine = create_search_engine(cfg)
+    sengine.add_documents(
+        [
+            Input(
+                uuid="recent",
+                url="r",
+                title="recent",
+                content="solar power grid",
+                published=anchor,
+            ),
+            Input(
+                uuid="old",
+                url="o",
+                title="old",
+                content="solar power grid",
+                published=anchor - timedelta(days=90),
+            ),
+            Input(uuid="undated", url="u", title="undated", content="solar power grid"),
+        ],
+        lambda inp: inp,
+    )
+    sengine.flush()
+
+    item = Input(
+        uuid="item", url="i", title="item", content="solar power grid", published=anchor
+    )
+    results = sengine.search_item(item, limit=10)
+    sengine.close()
+
+    assert sorted(r.article_uuid for r in results) == ["recent", "undated"]